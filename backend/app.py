@@ -3,11 +3,22 @@ Mkulima AI Flask Backend
 AI-Powered Plant Disease Detection System
 """
 
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Request, Response, jsonify, request, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_migrate import Migrate
 import os
+from tempfile import SpooledTemporaryFile
 from datetime import datetime
-import json
+import functools
+import hashlib
+import orjson
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import redis
+from sqlalchemy.exc import IntegrityError
 
 # Import custom modules
 from services.image_processor import ImageProcessor
@@ -15,17 +26,113 @@ from services.disease_predictor import DiseasePredictor
 from utils.validators import validate_image_file
 from models.database import db, DiseaseReport
 
+# Outbreak analytics response, serialized once at import.
+# This would typically connect to a data analytics service.
+_TIMESTAMP_PLACEHOLDER = b'__TIMESTAMP__'
+_OUTBREAK_BODY_TEMPLATE = orjson.dumps({
+    "status": "success",
+    "analytics": {
+        "timestamp": _TIMESTAMP_PLACEHOLDER.decode(),
+        "alerts": [
+            {"region": "Central", "disease": "Late Blight", "severity": "high", "cases": 45},
+            {"region": "Rift Valley", "disease": "Maize Lethal Necrosis", "severity": "medium", "cases": 28},
+            {"region": "Western", "disease": "Coffee Berry Disease", "severity": "low", "cases": 12}
+        ],
+        "trends": {
+            "total_cases": 385,
+            "most_common_disease": "Tomato Yellow Leaf Curl Virus",
+            "emerging_threat": "Fall Armyworm"
+        }
+    }
+})
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson"""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+class SpooledRequest(Request):
+    """Request that buffers small uploads in memory, large ones on disk"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_SIZE'], mode='rb+')
+
 app = Flask(__name__)
+app.request_class = SpooledRequest
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for mobile app
 
 # Configuration
 app.config.from_pyfile('config.py')
+SpooledRequest.max_form_memory_size = app.config['MAX_FORM_MEMORY_SIZE']
 db.init_app(app)
+migrate = Migrate(app, db)  # Schema changes: backend/migrations, `flask db upgrade`
 
 # Initialize services
 image_processor = ImageProcessor()
 disease_predictor = DiseasePredictor()
 
+# Request coalescer: concurrent uploads are batched into one invoke()
+predict_queue = queue.Queue()
+
+def predict_worker():
+    """Drain the predict queue in short windows and run batched inference"""
+    while True:
+        batch = [predict_queue.get()]
+        deadline = time.monotonic() + app.config['PREDICT_BATCH_WINDOW']
+        
+        while len(batch) < app.config['PREDICT_MAX_BATCH']:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(predict_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        images = [image for image, _ in batch]
+        try:
+            results = disease_predictor.submit_batch(images).result()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+def predict_coalesced(image):
+    """Queue an image for batched prediction and wait for its result"""
+    future = Future()
+    predict_queue.put((image, future))
+    return future.result()
+
+threading.Thread(target=predict_worker, daemon=True).start()
+
+# Prediction cache (cache-aside, keyed by image SHA-256)
+cache = redis.Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+    app.config['REDIS_URL'],
+    max_connections=app.config['REDIS_MAX_CONNECTIONS']
+))
+
+def get_cached_prediction(image_hash):
+    """Return a cached prediction for an image hash, or None on miss"""
+    try:
+        cached = cache.get(f"pred:{image_hash}")
+    except redis.RedisError:
+        return None
+    return orjson.loads(cached) if cached else None
+
+def cache_prediction(image_hash, prediction):
+    """Store a prediction in the cache; failures are non-fatal"""
+    try:
+        cache.setex(f"pred:{image_hash}", app.config['CACHE_TIMEOUT'], app.json.dumps(prediction))
+    except redis.RedisError:
+        pass
+
 @app.route('/')
 def home():
     """API Home endpoint"""
@@ -77,49 +184,84 @@ def predict_disease():
         location = request.form.get('location', '')
         farmer_id = request.form.get('farmer_id', '')
         
-        # Process image
-        processed_image = image_processor.preprocess(image_file)
+        # Read the upload once: the same bytes are hashed and decoded
+        image_bytes = image_file.stream.read()
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        
+        prediction = get_cached_prediction(image_hash)
+        cache_status = "hit" if prediction is not None else "miss"
         
-        # Predict disease
-        prediction = disease_predictor.predict(processed_image)
+        if prediction is None:
+            # Process image. Validation only parses the header, so a
+            # truncated or corrupt body first shows up here
+            try:
+                processed_image = image_processor.preprocess_bytes(
+                    image_bytes,
+                    source_size=validation_result['dimensions'],
+                    **disease_predictor.required_input_spec
+                )
+            except ValueError as e:
+                return jsonify({"error": f"Invalid image file: {str(e)}"}), 400
+            
+            # Predict disease
+            prediction = predict_coalesced(processed_image)
+            cache_prediction(image_hash, prediction)
         
         # Save to database if farmer_id provided
         if farmer_id:
-            report = DiseaseReport(
-                farmer_id=farmer_id,
-                crop_type=crop_type,
-                location=location,
-                prediction=prediction,
-                confidence=prediction['confidence'],
-                image_path=f"uploads/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg"
-            )
-            db.session.add(report)
-            db.session.commit()
+            report = DiseaseReport.query.filter_by(farmer_id=farmer_id, image_hash=image_hash).first()
+            if report is None:
+                report = DiseaseReport(
+                    farmer_id=farmer_id,
+                    crop_type=crop_type,
+                    location=location,
+                    prediction=prediction,
+                    confidence=prediction['confidence'],
+                    image_path=f"uploads/{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.jpg",
+                    image_hash=image_hash
+                )
+                db.session.add(report)
+                try:
+                    db.session.commit()
+                except IntegrityError:
+                    # A concurrent identical upload inserted it first
+                    db.session.rollback()
+                    report = DiseaseReport.query.filter_by(farmer_id=farmer_id, image_hash=image_hash).one()
             prediction['report_id'] = report.id
         
         return jsonify({
             "status": "success",
             "prediction": prediction,
+            "cache": cache_status,
             "timestamp": datetime.utcnow().isoformat()
         })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@functools.lru_cache(maxsize=256)
+def treatment_response_body(disease_name):
+    """Serialized treatment response for a disease, or None if unknown"""
+    treatment_info = disease_predictor.get_treatment_info(disease_name)
+    if not treatment_info:
+        return None
+    
+    return orjson.dumps({
+        "status": "success",
+        "disease": disease_name,
+        "treatment": treatment_info
+    })
+
 @app.route('/api/treatment/<disease_name>', methods=['GET'])
 def get_treatment(disease_name):
     """Get treatment recommendations for a specific disease"""
     try:
-        treatment_info = disease_predictor.get_treatment_info(disease_name)
+        body = treatment_response_body(disease_name)
         
-        if not treatment_info:
+        if body is None:
             return jsonify({"error": "Treatment information not found"}), 404
         
-        return jsonify({
-            "status": "success",
-            "disease": disease_name,
-            "treatment": treatment_info
-        })
+        return Response(body, mimetype='application/json')
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -132,20 +274,36 @@ def get_history():
         return jsonify({"error": "farmer_id parameter required"}), 400
     
     try:
-        reports = DiseaseReport.query.filter_by(farmer_id=farmer_id)\
-            .order_by(DiseaseReport.created_at.desc())\
-            .limit(20)\
-            .all()
+        # Single Core select of the returned columns (no ORM hydration).
+        # Only the recommendations subtree of the prediction JSON is
+        # extracted and decoded; disease_name has its own column.
+        rows = db.session.execute(
+            db.select(
+                DiseaseReport.id,
+                DiseaseReport.crop_type,
+                DiseaseReport.confidence,
+                DiseaseReport.location,
+                DiseaseReport.created_at,
+                db.func.coalesce(
+                    DiseaseReport.disease_name,
+                    DiseaseReport.prediction['disease_name'].as_string()
+                ).label('disease_name'),
+                DiseaseReport.prediction['recommendations'].label('recommendations')
+            )
+            .where(DiseaseReport.farmer_id == farmer_id)
+            .order_by(DiseaseReport.created_at.desc())
+            .limit(20)
+        ).all()
         
         history = [{
-            "id": report.id,
-            "crop_type": report.crop_type,
-            "disease": report.prediction.get('disease_name'),
-            "confidence": report.confidence,
-            "location": report.location,
-            "timestamp": report.created_at.isoformat(),
-            "recommendations": report.prediction.get('recommendations', [])
-        } for report in reports]
+            "id": row.id,
+            "crop_type": row.crop_type,
+            "disease": row.disease_name,
+            "confidence": row.confidence,
+            "location": row.location,
+            "timestamp": row.created_at.isoformat(),
+            "recommendations": row.recommendations or []
+        } for row in rows]
         
         return jsonify({
             "status": "success",
@@ -160,35 +318,16 @@ def get_history():
 @app.route('/api/analytics/outbreaks', methods=['GET'])
 def outbreak_analytics():
     """Get disease outbreak analytics for monitoring"""
-    try:
-        # This would typically connect to a data analytics service
-        outbreaks = {
-            "timestamp": datetime.utcnow().isoformat(),
-            "alerts": [
-                {"region": "Central", "disease": "Late Blight", "severity": "high", "cases": 45},
-                {"region": "Rift Valley", "disease": "Maize Lethal Necrosis", "severity": "medium", "cases": 28},
-                {"region": "Western", "disease": "Coffee Berry Disease", "severity": "low", "cases": 12}
-            ],
-            "trends": {
-                "total_cases": 385,
-                "most_common_disease": "Tomato Yellow Leaf Curl Virus",
-                "emerging_threat": "Fall Armyworm"
-            }
-        }
-        
-        return jsonify({
-            "status": "success",
-            "analytics": outbreaks
-        })
-        
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    body = _OUTBREAK_BODY_TEMPLATE.replace(
+        _TIMESTAMP_PLACEHOLDER, datetime.utcnow().isoformat().encode(), 1
+    )
+    return Response(body, mimetype='application/json')
 
 if __name__ == '__main__':
     # Create uploads directory if it doesn't exist
     os.makedirs('uploads', exist_ok=True)
     
-    # Run the app
+    # Development server only; production runs under gunicorn (gunicorn_conf.py)
     app.run(
         host=app.config.get('HOST', '0.0.0.0'),
         port=app.config.get('PORT', 5000),
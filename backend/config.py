@@ -22,12 +22,16 @@ SQLALCHEMY_ECHO = DEBUG
 
 # File Upload Configuration
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+MAX_FORM_MEMORY_SIZE = 1024 * 1024  # 1MB max for non-file form fields
+UPLOAD_SPOOL_SIZE = 2 * 1024 * 1024  # Uploads above 2MB spill to a temp file
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 
 # ML Model Configuration
 MODEL_PATH = os.path.join(BASE_DIR, '../ml_model/models/plant_disease_model.tflite')
 LABELS_PATH = os.path.join(BASE_DIR, '../ml_model/models/labels.txt')
+PREDICT_BATCH_WINDOW = 0.008  # Seconds to wait for concurrent uploads to coalesce
+PREDICT_MAX_BATCH = 8
 
 # API Configuration
 API_PREFIX = '/api'
@@ -49,6 +53,7 @@ JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=30)
 # Redis Configuration (for caching)
 REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
 CACHE_TIMEOUT = 300  # 5 minutes
+REDIS_MAX_CONNECTIONS = 50  # Per worker; greenlets wait for a free connection
 
 # External API Keys
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY', '')
@@ -0,0 +1,34 @@
+"""
+Gunicorn Configuration
+Production server settings for the Mkulima AI backend
+
+Run from the backend directory:
+    gunicorn -c gunicorn_conf.py app:app
+"""
+
+import multiprocessing
+import os
+
+# nginx proxies to this socket (see nginx.conf)
+bind = os.environ.get('GUNICORN_BIND', 'unix:/run/mkulima_ai/gunicorn.sock')
+
+# Workers
+# gevent greenlets handle upload/DB I/O; TFLite inference runs on a
+# native thread per worker (see app.py), so it is never monkey-patched.
+# Each worker's interpreter already uses INFERENCE_THREADS cores (same
+# formula as services/disease_predictor.py, not imported here to keep
+# TensorFlow out of the master), so size workers to fill the CPUs once
+# rather than oversubscribe them; fewer workers also fill the predict
+# batches better
+_cpu_count = multiprocessing.cpu_count()
+_inference_threads = max(2, _cpu_count // 2)
+workers = int(os.environ.get('GUNICORN_WORKERS', max(1, _cpu_count // _inference_threads)))
+worker_class = 'gevent'
+worker_connections = 1000
+keepalive = 30
+timeout = 120
+
+# Logging
+loglevel = 'info'
+accesslog = 'logs/access.log'
+errorlog = 'logs/error.log'
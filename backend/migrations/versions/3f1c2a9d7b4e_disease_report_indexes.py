@@ -0,0 +1,89 @@
+"""disease_reports: JSONB predictions, history index, per-farmer image dedup
+
+Brings databases created from the original models in line with
+DiseaseReport's __table_args__:
+
+- adds ix_reports_farmer_created (farmer_id, created_at DESC) for
+  /api/history and drops the single-column farmer_id index it covers
+- replaces the table-wide unique image_hash constraint with
+  uq_reports_farmer_image on (farmer_id, image_hash)
+- converts prediction from JSON text to JSONB on PostgreSQL, so the
+  history query can read prediction['disease_name'] in SQL (other
+  databases keep storing JSON as text)
+
+Databases created from the current models already have this schema;
+mark them with `flask db stamp head` instead of upgrading.
+
+Revision ID: 3f1c2a9d7b4e
+Revises:
+Create Date: 2026-10-15 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b4e'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _drop_image_hash_unique():
+    """Drop the unique constraint/index on image_hash alone, whatever its name"""
+    inspector = sa.inspect(op.get_bind())
+    for constraint in inspector.get_unique_constraints('disease_reports'):
+        if constraint['column_names'] == ['image_hash']:
+            op.drop_constraint(constraint['name'], 'disease_reports', type_='unique')
+    for index in inspector.get_indexes('disease_reports'):
+        if index['unique'] and index['column_names'] == ['image_hash']:
+            op.drop_index(index['name'], table_name='disease_reports')
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column(
+            'disease_reports', 'prediction',
+            type_=postgresql.JSONB(),
+            existing_type=sa.Text(),
+            existing_nullable=False,
+            postgresql_using='prediction::jsonb'
+        )
+
+    op.create_index(
+        'ix_reports_farmer_created',
+        'disease_reports',
+        ['farmer_id', sa.text('created_at DESC')]
+    )
+    op.drop_index('ix_disease_reports_farmer_id', table_name='disease_reports')
+
+    _drop_image_hash_unique()
+    op.create_unique_constraint(
+        'uq_reports_farmer_image',
+        'disease_reports',
+        ['farmer_id', 'image_hash']
+    )
+
+
+def downgrade():
+    # Fails if two farmers have since reported the same image
+    op.drop_constraint('uq_reports_farmer_image', 'disease_reports', type_='unique')
+    op.create_unique_constraint(
+        'disease_reports_image_hash_key',
+        'disease_reports',
+        ['image_hash']
+    )
+
+    op.create_index('ix_disease_reports_farmer_id', 'disease_reports', ['farmer_id'])
+    op.drop_index('ix_reports_farmer_created', table_name='disease_reports')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column(
+            'disease_reports', 'prediction',
+            type_=sa.Text(),
+            existing_type=postgresql.JSONB(),
+            existing_nullable=False,
+            postgresql_using='prediction::text'
+        )
@@ -4,8 +4,16 @@ Database configuration and base model
 
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+import orjson
 
-db = SQLAlchemy()
+def json_serializer(value):
+    """Serialize JSON columns with orjson (numpy scalars allowed)"""
+    return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+db = SQLAlchemy(engine_options={
+    'json_serializer': json_serializer,
+    'json_deserializer': orjson.loads
+})
 
 class BaseModel(db.Model):
     """Base model with common fields"""
@@ -4,27 +4,35 @@ Stores predictions made by the AI system
 """
 
 from .database import BaseModel, db
-import json
+from sqlalchemy.dialects.postgresql import JSONB
+import orjson
 
 class DiseaseReport(BaseModel):
     """Model for storing disease prediction reports"""
     __tablename__ = 'disease_reports'
+    __table_args__ = (
+        # Serves /api/history: range scan on farmer_id, already ordered by date
+        db.Index('ix_reports_farmer_created', 'farmer_id', db.desc('created_at')),
+        # Duplicate detection is per farmer: the same photo from two
+        # farmers is two reports
+        db.UniqueConstraint('farmer_id', 'image_hash', name='uq_reports_farmer_image'),
+    )
     
-    farmer_id = db.Column(db.String(100), nullable=False, index=True)
+    farmer_id = db.Column(db.String(100), nullable=False)
     crop_type = db.Column(db.String(50), nullable=False)
     location = db.Column(db.String(200))
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
     
     # Prediction results
-    prediction = db.Column(db.Text, nullable=False)  # JSON string
+    prediction = db.Column(db.JSON().with_variant(JSONB(), 'postgresql'), nullable=False)
     confidence = db.Column(db.Float, nullable=False)
     severity_level = db.Column(db.String(20))  # low, medium, high
     disease_name = db.Column(db.String(100))
     
     # Image information
     image_path = db.Column(db.String(500))
-    image_hash = db.Column(db.String(64), unique=True)  # For duplicate detection
+    image_hash = db.Column(db.String(64))  # For duplicate detection, see __table_args__
     
     # Treatment
     treatment_applied = db.Column(db.Boolean, default=False)
@@ -42,24 +50,31 @@ class DiseaseReport(BaseModel):
     
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        if 'prediction' and isinstance(self.prediction, dict):
-            self.prediction = json.dumps(self.prediction)
-            # Extract disease name from prediction if not provided
-            if not self.disease_name and 'disease_name' in self.prediction_dict:
-                self.disease_name = self.prediction_dict['disease_name']
+        pred = kwargs.get('prediction')
+        if isinstance(pred, (bytes, str)):
+            # Already serialized: parse once so the JSON column stores an object
+            pred = orjson.loads(pred)
+            self.prediction = pred
+        
+        # Extract disease name from prediction if not provided
+        if isinstance(pred, dict) and not self.disease_name:
+            self.disease_name = pred.get('disease_name')
     
     @property
     def prediction_dict(self):
         """Get prediction as dictionary"""
+        if isinstance(self.prediction, dict):
+            return self.prediction
         try:
-            return json.loads(self.prediction)
-        except (json.JSONDecodeError, TypeError):
+            # Rows written before the JSON column type stored plain text
+            return orjson.loads(self.prediction)
+        except (orjson.JSONDecodeError, TypeError):
             return {}
     
     @prediction_dict.setter
     def prediction_dict(self, value):
         """Set prediction from dictionary"""
-        self.prediction = json.dumps(value)
+        self.prediction = value
     
     def to_dict(self):
         """Convert to dictionary with prediction parsed"""
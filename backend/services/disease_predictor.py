@@ -5,13 +5,201 @@ Handles ML model inference for plant disease detection
 
 import tensorflow as tf
 import numpy as np
-import json
+import numba
+import mmap
 import os
-from typing import Dict, List, Optional
+import time
+import types
+from typing import Dict, List, Optional, Sequence, Tuple
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from gevent import monkey as _gevent_monkey
+except ImportError:
+    _gevent_monkey = None
+
+def _make_inference_executor():
+    """
+    Single-thread executor for the interpreter
+    
+    gevent's pool (whose futures yield to other greenlets while waiting)
+    only works from the thread running its hub, so it is used only when
+    gevent has monkey-patched threading; plain threads (python app.py,
+    sync gunicorn workers) get the stdlib executor.
+    """
+    if _gevent_monkey is not None and _gevent_monkey.is_module_patched('threading'):
+        from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+        return GeventThreadPoolExecutor(max_workers=1)
+    return ThreadPoolExecutor(max_workers=1)
 
 logger = logging.getLogger(__name__)
 
+SEVERITY_LEVELS = ('low', 'medium', 'high')
+
+# Interpreter threads for the XNNPACK CPU kernels
+INFERENCE_THREADS = max(2, (os.cpu_count() or 2) // 2)
+
+def _batch_bucket(batch_size: int) -> int:
+    """
+    Interpreter batch size for batch_size images: the next power of two
+    
+    Resizing the input re-prepares the XNNPACK delegate, so batches are
+    padded to a handful of fixed sizes (1, 2, 4, 8, ...) instead of
+    resizing for every distinct coalesced batch size.
+    """
+    return 1 << (batch_size - 1).bit_length()
+
+# Reference data shared across requests (read-only, built once at import)
+# This would typically come from a database or external API
+_TREATMENTS_DB = types.MappingProxyType({
+    'tomato_early_blight': (
+        {
+            'type': 'chemical',
+            'name': 'Chlorothalonil',
+            'dosage': 'Apply 1-2 lbs per acre',
+            'frequency': 'Every 7-10 days',
+            'safety': 'Wear protective equipment',
+            'organic_alternative': 'Copper-based fungicides'
+        },
+        {
+            'type': 'cultural',
+            'name': 'Crop rotation',
+            'description': 'Rotate with non-solanaceous crops',
+            'effectiveness': 'High'
+        }
+    ),
+    'maize_rust': (
+        {
+            'type': 'chemical',
+            'name': 'Triazole fungicides',
+            'dosage': 'Apply as per manufacturer instructions',
+            'frequency': 'At first sign of disease',
+            'safety': 'Follow label instructions'
+        },
+    )
+})
+
+# Static fields of the general advice for unknown diseases; the
+# description names the disease, see get_treatment_recommendations
+_DEFAULT_TREATMENT = types.MappingProxyType({
+    'type': 'general',
+    'name': 'Consult agricultural expert',
+    'contact': 'Call 0111-222-333 for expert advice'
+})
+
+_SEVERITY_DESCRIPTIONS = types.MappingProxyType({
+    'low': 'Early stage infection. Monitor regularly.',
+    'medium': 'Moderate infection. Treatment recommended.',
+    'high': 'Severe infection. Immediate treatment required.'
+})
+
+# In production, this would query a database
+_SIMILAR_CASES = (
+    {
+        'case_id': 'case_001',
+        'location': 'Central Province',
+        'date': '2023-10-15',
+        'severity': 'medium',
+        'treatment_applied': 'Copper fungicide',
+        'outcome': 'Recovered'
+    },
+    {
+        'case_id': 'case_002',
+        'location': 'Rift Valley',
+        'date': '2023-09-22',
+        'severity': 'high',
+        'treatment_applied': 'Systemic fungicide',
+        'outcome': 'Partial recovery'
+    }
+)
+
+@numba.njit(cache=True)
+def _severity_code(confidence: float) -> int:
+    """Map confidence to an index into SEVERITY_LEVELS"""
+    if confidence > 0.8:
+        return 2
+    elif confidence > 0.6:
+        return 1
+    return 0
+
+@numba.njit(cache=True, fastmath=True)
+def _topk_and_severity(scores: np.ndarray, k: int = 3) -> Tuple[int, float, np.ndarray, np.ndarray]:
+    """
+    Top-k scores and severity estimate in a single pass over the scores
+    
+    Args:
+        scores: 1-D model output scores
+        k: Number of top predictions to keep
+        
+    Returns:
+        (severity code, affected area %, top-k indices, top-k scores),
+        with indices/scores sorted by descending score
+    """
+    top_indices = np.empty(k, dtype=np.int64)
+    top_scores = np.empty(k, dtype=np.float64)
+    filled = 0
+    
+    # Linear scan keeping a small sorted window: O(N) like argpartition, but
+    # without its index array or the follow-up argsort of the k winners
+    for i in range(scores.shape[0]):
+        value = scores[i]
+        if filled == k and value <= top_scores[k - 1]:
+            continue
+        j = filled if filled < k else k - 1
+        while j > 0 and value > top_scores[j - 1]:
+            top_scores[j] = top_scores[j - 1]
+            top_indices[j] = top_indices[j - 1]
+            j -= 1
+        top_scores[j] = value
+        top_indices[j] = i
+        if filled < k:
+            filled += 1
+    
+    confidence = top_scores[0]
+    # Simplified; in practice a segmentation model (U-Net) would measure it
+    affected_area = min(confidence * 100.0, 95.0)
+    
+    return _severity_code(confidence), affected_area, top_indices[:filled], top_scores[:filled]
+
+class MappedLabels(Sequence):
+    """
+    Read-only label list backed by a memory-mapped labels file
+    
+    One label per line. Only the line offsets are kept in memory; a label
+    is decoded when it is indexed.
+    """
+    
+    def __init__(self, labels_path: str):
+        if os.path.getsize(labels_path) == 0:
+            self._data = b''
+            self._offsets = np.zeros(1, dtype=np.int64)
+            return
+        
+        with open(labels_path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        # Line i spans offsets[i]:offsets[i + 1] (newline included, stripped on access)
+        newlines = np.flatnonzero(np.frombuffer(self._data, dtype=np.uint8) == ord('\n'))
+        starts = [np.zeros(1, dtype=np.int64), newlines + 1]
+        if not newlines.size or newlines[-1] != len(self._data) - 1:
+            starts.append(np.array([len(self._data)], dtype=np.int64))
+        self._offsets = np.concatenate(starts)
+    
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('label index out of range')
+        
+        return self._data[self._offsets[index]:self._offsets[index + 1]].decode().strip()
+
 class DiseasePredictor:
     """Service for plant disease prediction using TensorFlow Lite"""
     
@@ -25,9 +213,27 @@ class DiseasePredictor:
         """
         self.model = None
         self.labels = []
+        self._input_buffer = None
+        self._batch_size = 1
         self.model_path = model_path
         self.labels_path = labels_path
         
+        # The interpreter is not thread-safe: all inference goes through one
+        # native thread. Swapping in a GPU/EdgeTPU delegate only changes the
+        # interpreter this thread drives, not the callers.
+        self._executor = _make_inference_executor()
+        
+        # Input tensor contract for ImageProcessor, refined by load_model()
+        self.required_input_spec = {
+            'target_shape': (1, 224, 224, 3),
+            'dtype': np.float32,
+            'scale': 0.0,
+            'zero_point': 0
+        }
+        
+        # Warm the JIT cache so the first request doesn't pay for compilation
+        _topk_and_severity(np.zeros(3, dtype=np.float32))
+        
         if model_path and labels_path:
             self.load_model(model_path, labels_path)
     
@@ -35,18 +241,25 @@ class DiseasePredictor:
         """
         Load TensorFlow Lite model and labels
         
+        The interpreter runs on the XNNPACK delegate (applied by default
+        by TensorFlow Lite) with INFERENCE_THREADS threads. XNNPACK only
+        accelerates float32 and dynamic-range/INT8 quantized models;
+        float16 weights fall back to the reference kernels.
+        
         Args:
             model_path: Path to .tflite model file
             labels_path: Path to labels.txt file
         """
         try:
             # Load model
-            self.model = tf.lite.Interpreter(model_path=model_path)
+            self.model = tf.lite.Interpreter(
+                model_path=model_path,
+                num_threads=INFERENCE_THREADS
+            )
             self.model.allocate_tensors()
             
             # Load labels
-            with open(labels_path, 'r') as f:
-                self.labels = [line.strip() for line in f.readlines()]
+            self.labels = MappedLabels(labels_path)
             
             # Get model details
             input_details = self.model.get_input_details()
@@ -54,6 +267,29 @@ class DiseasePredictor:
             
             self.input_shape = input_details[0]['shape']
             self.output_shape = output_details[0]['shape']
+            # Interpreter constants cached once; get_*_details() builds
+            # fresh dicts on every call so it stays off the request path
+            self._in_idx = input_details[0]['index']
+            self._in_shape = tuple(int(dim) for dim in self.input_shape)
+            self._out_idx = output_details[0]['index']
+            
+            # Quantization params, (0.0, 0) for float tensors
+            self._in_dtype = input_details[0]['dtype']
+            self._in_quant = input_details[0]['quantization']
+            self._out_quant = output_details[0]['quantization']
+            
+            # Exact tensor ImageProcessor must produce for a single image
+            input_height, input_width = self._in_shape[1:3]
+            self.required_input_spec = {
+                'target_shape': (1, input_height, input_width, 3),
+                'dtype': self._in_dtype,
+                'scale': self._in_quant[0],
+                'zero_point': self._in_quant[1]
+            }
+            
+            # Reusable batch tensor (set_tensor copies, so sharing is safe)
+            self._batch_size = 1
+            self._input_buffer = np.empty((1, input_height, input_width, 3), dtype=self._in_dtype)
             
             logger.info(f"Model loaded successfully: {model_path}")
             logger.info(f"Input shape: {self.input_shape}")
@@ -64,37 +300,43 @@ class DiseasePredictor:
             logger.error(f"Failed to load model: {str(e)}")
             raise
     
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
+    def _ensure_batch_size(self, batch_size: int):
         """
-        Preprocess image for model input
+        Resize the interpreter input to the given batch size
+        
+        The last batch size is cached so tensors are only re-allocated
+        when it changes. Callers pass _batch_bucket() sizes.
         
         Args:
-            image: Input image array
-            
-        Returns:
-            Preprocessed image array
+            batch_size: Number of images per invoke()
         """
-        # Resize to model input size
-        input_height, input_width = self.input_shape[1:3]
-        resized = tf.image.resize(image, [input_height, input_width])
+        if batch_size == self._batch_size:
+            return
         
-        # Normalize to [0, 1]
-        normalized = resized / 255.0
+        input_height, input_width = self._in_shape[1:3]
+        self.model.resize_tensor_input(self._in_idx, (batch_size, input_height, input_width, 3))
+        self.model.allocate_tensors()
         
-        # Convert to float32
-        processed = normalized.astype(np.float32)
+        self._batch_size = batch_size
+        # Zeroed so the padding rows of a partial batch hold valid input
+        self._input_buffer = np.zeros((batch_size, input_height, input_width, 3), dtype=self._in_dtype)
+    
+    def _read_output(self) -> np.ndarray:
+        """Fetch the output tensor, dequantized to float32 if needed"""
+        predictions = self.model.get_tensor(self._out_idx)
         
-        # Add batch dimension
-        processed = np.expand_dims(processed, axis=0)
+        scale, zero_point = self._out_quant
+        if scale:
+            predictions = (predictions.astype(np.float32) - zero_point) * np.float32(scale)
         
-        return processed
+        return predictions
     
     def predict(self, image: np.ndarray) -> Dict:
         """
         Predict disease from image
         
         Args:
-            image: Preprocessed image array
+            image: Model input tensor matching required_input_spec
             
         Returns:
             Dictionary with prediction results
@@ -103,84 +345,126 @@ class DiseasePredictor:
             raise ValueError("Model not loaded. Call load_model() first.")
         
         try:
-            # Preprocess image
-            processed_image = self.preprocess_image(image)
+            self._ensure_batch_size(1)
             
             # Set input tensor
-            input_details = self.model.get_input_details()
-            self.model.set_tensor(input_details[0]['index'], processed_image)
+            self.model.set_tensor(self._in_idx, image)
             
             # Run inference
             self.model.invoke()
             
             # Get output tensor
-            output_details = self.model.get_output_details()
-            predictions = self.model.get_tensor(output_details[0]['index'])
+            predictions = self._read_output()
             
-            # Get top prediction
-            top_index = np.argmax(predictions[0])
-            confidence = float(predictions[0][top_index])
-            disease_name = self.labels[top_index]
+            return self._build_result(predictions[0])
             
-            # Get top 3 predictions
-            top_indices = np.argsort(predictions[0])[-3:][::-1]
-            top_predictions = [
-                {
-                    'disease': self.labels[i],
-                    'confidence': float(predictions[0][i]),
-                    'rank': rank + 1
-                }
-                for rank, i in enumerate(top_indices)
-            ]
+        except Exception as e:
+            logger.error(f"Prediction failed: {str(e)}")
+            raise
+    
+    def predict_batch(self, images: List[np.ndarray]) -> List[Dict]:
+        """
+        Predict diseases for several images with a single invoke()
+        
+        Args:
+            images: Model input tensors matching required_input_spec
             
-            # Determine severity
-            severity = self.estimate_severity(image, disease_name, confidence)
+        Returns:
+            List of prediction results, in input order
+        """
+        if self.model is None:
+            raise ValueError("Model not loaded. Call load_model() first.")
+        
+        try:
+            num_images = len(images)
+            self._ensure_batch_size(_batch_bucket(num_images))
             
-            # Get treatment recommendations
-            recommendations = self.get_treatment_recommendations(disease_name)
+            if self._batch_size == 1:
+                batch = images[0]
+            else:
+                # Padding rows past num_images are ignored below
+                np.concatenate(images, axis=0, out=self._input_buffer[:num_images])
+                batch = self._input_buffer
             
-            # Get similar images for reference
-            similar_cases = self.find_similar_cases(disease_name)
+            self.model.set_tensor(self._in_idx, batch)
+            self.model.invoke()
+            predictions = self._read_output()[:num_images]
             
-            return {
-                'disease_name': disease_name,
-                'confidence': confidence,
-                'severity': severity,
-                'top_predictions': top_predictions,
-                'recommendations': recommendations,
-                'similar_cases': similar_cases,
-                'timestamp': tf.timestamp().numpy()
-            }
+            return [self._build_result(scores) for scores in predictions]
             
         except Exception as e:
-            logger.error(f"Prediction failed: {str(e)}")
+            logger.error(f"Batch prediction failed: {str(e)}")
             raise
     
-    def estimate_severity(self, image: np.ndarray, disease: str, confidence: float) -> Dict:
+    def submit(self, image: np.ndarray) -> Future:
         """
-        Estimate disease severity
+        Queue a prediction on the inference thread
         
         Args:
-            image: Input image
-            disease: Disease name
-            confidence: Prediction confidence
+            image: Model input tensor matching required_input_spec
             
         Returns:
-            Severity information
+            Future resolving to the predict() result
         """
-        # This is a simplified version
-        # In practice, you might use a segmentation model (U-Net) for this
+        return self._executor.submit(self.predict, image)
+    
+    def submit_batch(self, images: List[np.ndarray]) -> Future:
+        """
+        Queue a batched prediction on the inference thread
         
-        severity_level = 'low'
-        if confidence > 0.8:
-            severity_level = 'high'
-        elif confidence > 0.6:
-            severity_level = 'medium'
+        Args:
+            images: Model input tensors matching required_input_spec
+            
+        Returns:
+            Future resolving to the predict_batch() result
+        """
+        return self._executor.submit(self.predict_batch, images)
+    
+    def _build_result(self, scores: np.ndarray) -> Dict:
+        """
+        Build the prediction payload from one row of model output
         
-        # Calculate affected area percentage (simplified)
-        # In real implementation, use segmentation
-        affected_area = min(confidence * 100, 95)  # Simplified
+        Args:
+            scores: Output scores for a single image
+            
+        Returns:
+            Dictionary with prediction results
+        """
+        # Get top 3 predictions and severity in one pass
+        severity_code, affected_area, top_indices, top_scores = _topk_and_severity(scores)
+        confidence = float(top_scores[0])
+        disease_name = self.labels[top_indices[0]]
         
+        top_predictions = [
+            {
+                'disease': self.labels[i],
+                'confidence': float(score),
+                'rank': rank + 1
+            }
+            for rank, (i, score) in enumerate(zip(top_indices, top_scores))
+        ]
+        
+        # Determine severity
+        severity = self._severity_info(SEVERITY_LEVELS[severity_code], affected_area)
+        
+        # Get treatment recommendations
+        recommendations = self.get_treatment_recommendations(disease_name)
+        
+        # Get similar images for reference
+        similar_cases = self.find_similar_cases(disease_name)
+        
+        return {
+            'disease_name': disease_name,
+            'confidence': confidence,
+            'severity': severity,
+            'top_predictions': top_predictions,
+            'recommendations': recommendations,
+            'similar_cases': similar_cases,
+            'timestamp': time.time()
+        }
+    
+    def _severity_info(self, severity_level: str, affected_area: float) -> Dict:
+        """Build the severity payload for a level and affected area"""
         return {
             'level': severity_level,
             'affected_area_percentage': affected_area,
@@ -190,14 +474,9 @@ class DiseasePredictor:
     
     def get_severity_description(self, level: str) -> str:
         """Get description for severity level"""
-        descriptions = {
-            'low': 'Early stage infection. Monitor regularly.',
-            'medium': 'Moderate infection. Treatment recommended.',
-            'high': 'Severe infection. Immediate treatment required.'
-        }
-        return descriptions.get(level, 'Unknown severity level.')
+        return _SEVERITY_DESCRIPTIONS.get(level, 'Unknown severity level.')
     
-    def get_treatment_recommendations(self, disease: str) -> List[Dict]:
+    def get_treatment_recommendations(self, disease: str) -> Tuple[Dict, ...]:
         """
         Get treatment recommendations for a disease
         
@@ -205,51 +484,31 @@ class DiseasePredictor:
             disease: Disease name
             
         Returns:
-            List of treatment recommendations
+            Treatment recommendations (known diseases: shared, do not mutate)
         """
-        # This would typically come from a database or external API
-        # For now, return sample data
-        
-        treatments_db = {
-            'tomato_early_blight': [
-                {
-                    'type': 'chemical',
-                    'name': 'Chlorothalonil',
-                    'dosage': 'Apply 1-2 lbs per acre',
-                    'frequency': 'Every 7-10 days',
-                    'safety': 'Wear protective equipment',
-                    'organic_alternative': 'Copper-based fungicides'
-                },
-                {
-                    'type': 'cultural',
-                    'name': 'Crop rotation',
-                    'description': 'Rotate with non-solanaceous crops',
-                    'effectiveness': 'High'
-                }
-            ],
-            'maize_rust': [
-                {
-                    'type': 'chemical',
-                    'name': 'Triazole fungicides',
-                    'dosage': 'Apply as per manufacturer instructions',
-                    'frequency': 'At first sign of disease',
-                    'safety': 'Follow label instructions'
-                }
-            ]
-        }
-        
         # Return treatments for the disease or general advice
-        if disease in treatments_db:
-            return treatments_db[disease]
-        else:
-            return [{
-                'type': 'general',
-                'name': 'Consult agricultural expert',
-                'description': f'No specific treatment found for {disease}. Please consult local agricultural extension officer.',
-                'contact': 'Call 0111-222-333 for expert advice'
-            }]
+        treatments = _TREATMENTS_DB.get(disease)
+        if treatments is not None:
+            return treatments
+        
+        return ({
+            **_DEFAULT_TREATMENT,
+            'description': f'No specific treatment found for {disease}. Please consult local agricultural extension officer.'
+        },)
     
-    def find_similar_cases(self, disease: str, limit: int = 5) -> List[Dict]:
+    def get_treatment_info(self, disease: str) -> Optional[Tuple[Dict, ...]]:
+        """
+        Get treatment information for a known disease
+        
+        Args:
+            disease: Disease name
+            
+        Returns:
+            Treatment recommendations, or None if the disease is unknown
+        """
+        return _TREATMENTS_DB.get(disease)
+    
+    def find_similar_cases(self, disease: str, limit: int = 5) -> Tuple[Dict, ...]:
         """
         Find similar historical cases
         
@@ -258,28 +517,9 @@ class DiseasePredictor:
             limit: Maximum number of cases to return
             
         Returns:
-            List of similar cases
+            Similar cases (shared, do not mutate)
         """
-        # In production, this would query a database
-        # For now, return sample data
-        return [
-            {
-                'case_id': 'case_001',
-                'location': 'Central Province',
-                'date': '2023-10-15',
-                'severity': 'medium',
-                'treatment_applied': 'Copper fungicide',
-                'outcome': 'Recovered'
-            },
-            {
-                'case_id': 'case_002',
-                'location': 'Rift Valley',
-                'date': '2023-09-22',
-                'severity': 'high',
-                'treatment_applied': 'Systemic fungicide',
-                'outcome': 'Partial recovery'
-            }
-        ]
+        return _SIMILAR_CASES[:limit]
     
     def is_ready(self) -> bool:
         """Check if model is loaded and ready"""
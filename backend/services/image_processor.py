@@ -5,55 +5,397 @@ Handles image preprocessing and enhancement
 
 import cv2
 import numpy as np
-from PIL import Image, ImageEnhance
 import io
-from typing import Tuple, Optional
+import struct
+import threading
+from typing import Dict, Tuple, Optional
 import logging
 
+from ._fused_kernels import fused_enhance
+
 logger = logging.getLogger(__name__)
 
+# Enhancement factors (same semantics as PIL.ImageEnhance)
+CONTRAST_FACTOR = 1.2
+SHARPNESS_FACTOR = 1.1
+
+# PIL's Sharpness blends with its SMOOTH filter:
+# out = smooth + factor * (image - smooth), folded into one 3x3 kernel
+_SMOOTH_KERNEL = np.array([[1, 1, 1], [1, 5, 1], [1, 1, 1]], dtype=np.float32) / 13
+_SHARPEN_KERNEL = (1 - SHARPNESS_FACTOR) * _SMOOTH_KERNEL
+_SHARPEN_KERNEL[1, 1] += SHARPNESS_FACTOR
+
+# DCT-domain reduced JPEG decodes, largest reduction first
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2)
+)
+
+# Leaf segmentation: HSV green range and mask cleanup kernel
+_LOWER_GREEN = np.array([35, 40, 40], dtype=np.uint8)
+_UPPER_GREEN = np.array([85, 255, 255], dtype=np.uint8)
+_MORPH_KERNEL = np.ones((5, 5), np.uint8)
+
+# ImageNet channel statistics (RGB) for NCHW blobs
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# JPEG signature and start-of-frame markers (SOF0-SOF15 minus DHT, JPG, DAC)
+_JPEG_MAGIC = b'\xff\xd8\xff'
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# Scale factor below which resizing uses INTER_AREA; milder downscales and
+# upscales use the faster INTER_LINEAR
+_AREA_RATIO = 0.5
+
+# Histogram features are serialized as uint16 fixed point
+_HIST_SCALE = 65535
+
+# Set bits per byte value, for popcount on packed bitmaps (NumPy < 2.0)
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+# ITU-R 601 luma weights (PIL's RGB -> L conversion) for the contrast mean
+_LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+# Decoded images smaller than this are resized on the CPU even with a GPU:
+# below it the upload/download round trip costs more than the resize
+_GPU_MIN_PIXELS = 1024 * 1024
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read a JPEG's size from its frame header, skipping other segments
+    
+    Args:
+        data: Encoded JPEG bytes
+        
+    Returns:
+        (width, height), or None if no frame header is found
+    """
+    i = 2
+    end = len(data) - 9
+    while i < end:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+        elif marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', data, i + 5)
+            return width, height
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            i += 2
+        else:
+            i += 2 + struct.unpack_from('>H', data, i + 2)[0]
+    
+    return None
+
+def _cuda_available() -> bool:
+    """Whether OpenCV was built with CUDA and can see a device"""
+    try:
+        return hasattr(cv2, 'cuda') and cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except cv2.error:
+        return False
+
 class ImageProcessor:
     """Service for image preprocessing and enhancement"""
     
     def __init__(self):
         self.default_size = (224, 224)  # Common input size for MobileNet
+        
+        # Per-thread color conversion cache (the processor is shared across requests)
+        self._cache = threading.local()
+        
+        # Per-thread scratch buffers for intermediates that never leave a call
+        self._scratch = threading.local()
+        
+        # Resize large decodes on the GPU when OpenCV has CUDA support;
+        # each thread gets its own CUDA stream so requests can overlap
+        self.use_gpu = _cuda_available()
+        self._gpu_streams = threading.local()
+        if self.use_gpu:
+            logger.info("CUDA device found, resizing large images on the GPU")
+        
+        # Warm the JIT cache (float32 models) so the first request doesn't compile
+        self.to_input_tensor(np.zeros((8, 8, 3), dtype=np.uint8), target_shape=(1, 8, 8, 3))
     
-    def preprocess(self, image_file) -> np.ndarray:
+    def preprocess(self, image_file, **input_spec) -> np.ndarray:
         """
         Preprocess image file for ML model
         
         Args:
             image_file: Uploaded image file
+            input_spec: Model input spec, see to_input_tensor()
+            
+        Returns:
+            Model input tensor
+        """
+        return self.preprocess_bytes(image_file.read(), **input_spec)
+    
+    def preprocess_stream(self, stream, **input_spec) -> np.ndarray:
+        """
+        Preprocess an image from a binary stream, read in a single call
+        
+        Args:
+            stream: Binary file-like object (e.g. FileStorage.stream)
+            input_spec: Model input spec, see to_input_tensor()
+            
+        Returns:
+            Model input tensor
+        """
+        return self.preprocess_bytes(stream.read(), **input_spec)
+    
+    def preprocess_bytes(self, image_bytes: bytes, source_size: Tuple[int, int] = None,
+                         **input_spec) -> np.ndarray:
+        """
+        Preprocess raw encoded image bytes for ML model
+        
+        Args:
+            image_bytes: Encoded image (JPEG, PNG, ...)
+            source_size: Encoded image size (width, height) if known, e.g.
+                from validate_image_file(); lets large images decode reduced
+            input_spec: Model input spec, see to_input_tensor()
             
         Returns:
-            Preprocessed image array
+            Model input tensor
         """
+        self.clear_cache()
+        
         try:
-            # Read image
-            image_bytes = image_file.read()
+            target_shape = input_spec.get('target_shape')
+            if target_shape is None:
+                target_size = self.default_size
+            else:
+                target_size = (target_shape[2], target_shape[1])
             
-            # Convert to numpy array
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image = self.decode(image_bytes, target_size, source_size)
             
-            if image is None:
-                raise ValueError("Could not decode image")
+            # Color conversion, enhancement and scaling in one fused pass
+            return self.to_input_tensor(image, **input_spec)
+            
+        except Exception as e:
+            logger.error(f"Image preprocessing failed: {str(e)}")
+            raise
+    
+    def preprocess_to_blob(self, image_bytes: bytes, source_size: Tuple[int, int] = None,
+                           size: Tuple[int, int] = None, mean: Tuple[float, float, float] = IMAGENET_MEAN,
+                           std: Tuple[float, float, float] = IMAGENET_STD) -> np.ndarray:
+        """
+        Preprocess encoded image bytes into an NCHW float32 blob
+        
+        For models exported with ImageNet normalization (e.g. ONNX via
+        cv2.dnn). The TFLite model takes NHWC input, see preprocess_bytes().
+        
+        Args:
+            image_bytes: Encoded image (JPEG, PNG, ...)
+            source_size: Encoded image size (width, height) if known
+            size: Blob spatial size (width, height)
+            mean: Per-channel RGB mean, in [0, 1] units
+            std: Per-channel RGB standard deviation, in [0, 1] units
             
-            # Convert BGR to RGB
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        Returns:
+            Float32 tensor of shape (1, 3, height, width)
+        """
+        if size is None:
+            size = self.default_size
+        
+        try:
+            image = self.decode(image_bytes, size, source_size)
             
-            # Enhance image quality
-            enhanced = self.enhance_image(image)
+            # Resize, BGR -> RGB, mean subtraction, scaling and NCHW layout in one call
+            blob = cv2.dnn.blobFromImage(image, scalefactor=1 / 255.0, size=size,
+                                         mean=tuple(m * 255 for m in mean), swapRB=True, crop=False)
             
-            # Remove background (optional)
-            # segmented = self.remove_background(enhanced)
+            # Per-channel std is not supported by blobFromImage
+            blob /= np.asarray(std, dtype=np.float32).reshape(1, 3, 1, 1)
             
-            return enhanced
+            return blob
             
         except Exception as e:
-            logger.error(f"Image preprocessing failed: {str(e)}")
+            logger.error(f"Blob preprocessing failed: {str(e)}")
             raise
     
+    def clear_cache(self):
+        """Drop cached color conversions held for this thread"""
+        self._cache.__dict__.clear()
+    
+    def _get_hsv(self, image: np.ndarray) -> np.ndarray:
+        """
+        HSV version of an RGB image, converted at most once per image
+        
+        The cache keeps a reference to the source image, so it is matched by
+        identity; images must not be modified in place after analysis starts.
+        """
+        if getattr(self._cache, 'hsv_source', None) is not image:
+            self._cache.hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+            self._cache.hsv_source = image
+        return self._cache.hsv
+    
+    def _get_gray(self, image: np.ndarray) -> np.ndarray:
+        """Grayscale version of an RGB image, converted at most once per image"""
+        if getattr(self._cache, 'gray_source', None) is not image:
+            # The cache holds one image, so its gray plane can live in scratch
+            self._cache.gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY,
+                                            dst=self._scratch_buffer('gray', image.shape[:2]))
+            self._cache.gray_source = image
+        return self._cache.gray
+    
+    def _scratch_buffer(self, name: str, shape: Tuple[int, ...]) -> np.ndarray:
+        """
+        Reusable uint8 buffer for this thread, reallocated only on shape change
+        
+        Only for intermediates consumed within the call (or held by the
+        single-entry caches above); returned tensors are queued for batched
+        inference and must own their memory.
+        """
+        buffer = getattr(self._scratch, name, None)
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+            setattr(self._scratch, name, buffer)
+        return buffer
+    
+    def decode(self, image_bytes: bytes, target_size: Tuple[int, int],
+               source_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """
+        Decode image bytes at the smallest scale that covers the target size
+        
+        Reduced decoding only pays off for JPEG, where libjpeg scales inside
+        the IDCT; other formats are decoded at full size. Without a known
+        source size the JPEG frame header is read for it.
+        
+        Args:
+            image_bytes: Encoded image (JPEG, PNG, ...)
+            target_size: Size the image will be resized to (width, height)
+            source_size: Encoded image size (width, height) if known
+            
+        Returns:
+            BGR uint8 image array
+        """
+        # Convert to numpy array (zero-copy view over the bytes)
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        
+        if image_bytes[:3] == _JPEG_MAGIC:
+            flag = self.decode_flag(source_size or _jpeg_size(image_bytes), target_size)
+        else:
+            flag = cv2.IMREAD_COLOR
+        
+        image = cv2.imdecode(nparr, flag)
+        if image is None:
+            raise ValueError("Could not decode image")
+        
+        return image
+    
+    def decode_flag(self, source_size: Optional[Tuple[int, int]], target_size: Tuple[int, int]) -> int:
+        """
+        Pick the cheapest imdecode flag that still covers the target size
+        
+        Only the model input size is ever needed, so large photos are decoded
+        at 1/2, 1/4 or 1/8 scale (done inside libjpeg's IDCT for JPEGs).
+        
+        Args:
+            source_size: Encoded image size (width, height), or None if unknown
+            target_size: Size the image will be resized to (width, height)
+            
+        Returns:
+            cv2.IMREAD_* flag
+        """
+        if source_size is None:
+            return cv2.IMREAD_COLOR
+        
+        width, height = source_size
+        for factor, flag in _REDUCED_DECODE_FLAGS:
+            if width // factor >= target_size[0] and height // factor >= target_size[1]:
+                return flag
+        
+        return cv2.IMREAD_COLOR
+    
+    def to_input_tensor(self, image: np.ndarray, target_shape: Tuple[int, int, int, int] = None,
+                        dtype=np.float32, scale: float = 0.0, zero_point: int = 0) -> np.ndarray:
+        """
+        Turn a decoded BGR image into the exact tensor the model expects
+        
+        Resizes, then converts to RGB, enhances (see enhance_image) and
+        normalizes or quantizes with a single fused kernel. Pass
+        DiseasePredictor.required_input_spec as keyword arguments.
+        
+        Args:
+            image: BGR uint8 image array, as returned by cv2.imdecode
+            target_shape: Input tensor shape (1, height, width, 3)
+            dtype: Input tensor dtype
+            scale: Input quantization scale (0.0 for float models)
+            zero_point: Input quantization zero point
+            
+        Returns:
+            Input tensor of shape target_shape and dtype dtype
+        """
+        if target_shape is None:
+            target_shape = (1, self.default_size[1], self.default_size[0], 3)
+        
+        tensor = np.empty(target_shape, dtype=dtype)
+        
+        # Resize to model input size first so every later step touches
+        # only height x width pixels (uint8 in, uint8 out)
+        height, width = target_shape[1:3]
+        downscale = image.shape[0] > height or image.shape[1] > width
+        interpolation = self.interpolation_for(image.shape, (width, height))
+        if self.use_gpu and downscale and image.shape[0] * image.shape[1] >= _GPU_MIN_PIXELS:
+            resized = self._resize_gpu(image, (width, height), interpolation)
+        else:
+            resized = cv2.resize(image, (width, height), dst=self._scratch_buffer('rgb', (height, width, 3)),
+                                 interpolation=interpolation)
+        
+        # Contrast is stretched around the mean luminance
+        blue, green, red = cv2.mean(resized)[:3]
+        luma_mean = sum(w * m for w, m in zip(_LUMA_WEIGHTS, (red, green, blue)))
+        
+        if tensor.dtype == np.float32:
+            # Normalize to [0, 1]
+            alpha = np.full(3, 1 / 255.0, dtype=np.float32)
+            beta = np.zeros(3, dtype=np.float32)
+            quantize, lo, hi = False, 0.0, 0.0
+        else:
+            # Quantized input: q = x / 255 / scale + zero_point
+            info = np.iinfo(tensor.dtype)
+            alpha = np.full(3, 1 / (255.0 * scale), dtype=np.float32)
+            beta = np.full(3, zero_point, dtype=np.float32)
+            quantize, lo, hi = True, float(info.min), float(info.max)
+        
+        fused_enhance(resized, tensor[0], luma_mean, CONTRAST_FACTOR, _SHARPEN_KERNEL,
+                      alpha, beta, quantize, lo, hi)
+        
+        return tensor
+    
+    def _resize_gpu(self, image: np.ndarray, size: Tuple[int, int], interpolation: int) -> np.ndarray:
+        """
+        Resize on the GPU, downloading only the model-sized result
+        
+        Falls back to cv2.resize if the CUDA call fails.
+        
+        Args:
+            image: uint8 image array
+            size: Target size (width, height)
+            interpolation: cv2.INTER_* flag
+            
+        Returns:
+            Resized image array
+        """
+        try:
+            stream = getattr(self._gpu_streams, 'stream', None)
+            if stream is None:
+                stream = self._gpu_streams.stream = cv2.cuda_Stream()
+            
+            gpu_image = cv2.cuda_GpuMat()
+            gpu_image.upload(image, stream)
+            gpu_resized = cv2.cuda.resize(gpu_image, size, interpolation=interpolation, stream=stream)
+            resized = gpu_resized.download(stream)
+            stream.waitForCompletion()
+            
+            return resized
+            
+        except cv2.error as e:
+            logger.warning(f"GPU resize failed, using CPU: {str(e)}")
+            return cv2.resize(image, size, interpolation=interpolation)
+    
     def enhance_image(self, image: np.ndarray) -> np.ndarray:
         """
         Enhance image quality for better prediction
@@ -64,21 +406,16 @@ class ImageProcessor:
         Returns:
             Enhanced image array
         """
-        # Convert to PIL Image for enhancement
-        pil_image = Image.fromarray(image)
-        
-        # Enhance contrast
-        enhancer = ImageEnhance.Contrast(pil_image)
-        enhanced = enhancer.enhance(1.2)
+        # Enhance contrast around the mean luminance:
+        # (x - mean) * factor + mean, saturated to uint8
+        channel_means = cv2.mean(image)[:3]
+        mean = sum(w * m for w, m in zip(_LUMA_WEIGHTS, channel_means))
+        enhanced = cv2.addWeighted(image, CONTRAST_FACTOR, image, 0, (1 - CONTRAST_FACTOR) * mean)
         
-        # Enhance sharpness
-        enhancer = ImageEnhance.Sharpness(enhanced)
-        enhanced = enhancer.enhance(1.1)
+        # Enhance sharpness (stays uint8)
+        cv2.filter2D(enhanced, -1, _SHARPEN_KERNEL, dst=enhanced)
         
-        # Convert back to numpy
-        enhanced_array = np.array(enhanced)
-        
-        return enhanced_array
+        return enhanced
     
     def remove_background(self, image: np.ndarray) -> np.ndarray:
         """
@@ -91,29 +428,18 @@ class ImageProcessor:
             Image with background removed
         """
         # Convert to HSV
-        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
-        
-        # Define green color range for leaves
-        lower_green = np.array([35, 40, 40])
-        upper_green = np.array([85, 255, 255])
+        hsv = self._get_hsv(image)
         
-        # Create mask
-        mask = cv2.inRange(hsv, lower_green, upper_green)
+        # Create mask of green (leaf) pixels
+        mask = cv2.inRange(hsv, _LOWER_GREEN, _UPPER_GREEN)
         
-        # Apply morphological operations
-        kernel = np.ones((5, 5), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+        # Apply morphological operations, reusing the mask buffer
+        cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _MORPH_KERNEL, dst=mask)
+        cv2.morphologyEx(mask, cv2.MORPH_OPEN, _MORPH_KERNEL, dst=mask)
         
-        # Apply mask
-        result = cv2.bitwise_and(image, image, mask=mask)
-        
-        # Create white background
-        white_bg = np.ones_like(image) * 255
-        white_bg = cv2.bitwise_and(white_bg, white_bg, mask=cv2.bitwise_not(mask))
-        
-        # Combine
-        final = cv2.add(result, white_bg)
+        # Keep leaf pixels, paint the background white
+        final = image.copy()
+        final[mask == 0] = 255
         
         return final
     
@@ -131,9 +457,28 @@ class ImageProcessor:
         if size is None:
             size = self.default_size
         
-        resized = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        height, width = image.shape[:2]
+        if (width, height) == tuple(size):
+            return image
+        
+        resized = cv2.resize(image, size, interpolation=self.interpolation_for(image.shape, size))
         return resized
     
+    @staticmethod
+    def interpolation_for(shape: Tuple[int, ...], size: Tuple[int, int]) -> int:
+        """
+        Pick the resize interpolation for a source shape and target size
+        
+        Args:
+            shape: Source image shape (height, width, ...)
+            size: Target size (width, height)
+            
+        Returns:
+            cv2.INTER_AREA for large downscales, else cv2.INTER_LINEAR
+        """
+        ratio = max(size[0] / shape[1], size[1] / shape[0])
+        return cv2.INTER_AREA if ratio < _AREA_RATIO else cv2.INTER_LINEAR
+    
     def detect_leaf_edges(self, image: np.ndarray) -> np.ndarray:
         """
         Detect leaf edges for shape analysis
@@ -144,23 +489,32 @@ class ImageProcessor:
         Returns:
             Image with edges highlighted
         """
+        # Edges are cached per image like the color conversions
+        if getattr(self._cache, 'edges_source', None) is image:
+            return self._cache.edges
+        
         # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        gray = self._get_gray(image)
         
         # Apply Gaussian blur
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        blurred = cv2.GaussianBlur(gray, (5, 5), 0, dst=self._scratch_buffer('blur', gray.shape))
         
         # Detect edges using Canny
         edges = cv2.Canny(blurred, 50, 150)
         
+        self._cache.edges = edges
+        self._cache.edges_source = image
+        
         return edges
     
-    def calculate_symmetry(self, image: np.ndarray) -> float:
+    def calculate_symmetry(self, image: Optional[np.ndarray] = None, *,
+                           edges: Optional[np.ndarray] = None) -> float:
         """
         Calculate leaf symmetry (for health assessment)
         
         Args:
-            image: Input image array
+            image: Input image array (ignored when edges are given)
+            edges: Precomputed edge map from detect_leaf_edges
             
         Returns:
             Symmetry score (0-1)
@@ -168,7 +522,10 @@ class ImageProcessor:
         # This is a simplified implementation
         # In practice, you'd use more sophisticated methods
         
-        edges = self.detect_leaf_edges(image)
+        if edges is None:
+            if image is None:
+                raise ValueError("calculate_symmetry needs an image or edges")
+            edges = self.detect_leaf_edges(image)
         
         # Calculate moments
         moments = cv2.moments(edges)
@@ -193,8 +550,20 @@ class ImageProcessor:
         left_resized = left_half[:, :min_width]
         right_resized = right_flipped[:, :min_width]
         
-        # Calculate similarity
-        similarity = np.sum(left_resized == right_resized) / left_resized.size
+        # Centroid on the left edge: no half to compare (the old
+        # element-wise version returned nan here too)
+        if left_resized.size == 0:
+            return float('nan')
+        
+        # Calculate similarity: edges are a bitmap, so compare packed bits
+        # (8 pixels per byte) and count mismatches with popcount
+        mismatched = np.bitwise_xor(np.packbits(left_resized), np.packbits(right_resized))
+        if hasattr(np, 'bitwise_count'):
+            mismatches = int(np.bitwise_count(mismatched).sum())
+        else:
+            mismatches = int(_POPCOUNT_TABLE[mismatched].sum(dtype=np.int64))
+        
+        similarity = 1.0 - mismatches / left_resized.size
         
         return similarity
     
@@ -206,30 +575,28 @@ class ImageProcessor:
             image: Input image array
             
         Returns:
-            Dictionary of color features
+            Dictionary of color features; histograms are L2-normalized and
+            scaled to 0-65535 integers, moments are rounded to 3 decimals
         """
         # Convert to HSV
-        hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+        hsv = self._get_hsv(image)
         
-        # Calculate color histograms
+        # Calculate color histograms (calcHist reads each channel straight
+        # from the interleaved array, so no planes are split out)
         h_hist = cv2.calcHist([hsv], [0], None, [180], [0, 180])
         s_hist = cv2.calcHist([hsv], [1], None, [256], [0, 256])
         v_hist = cv2.calcHist([hsv], [2], None, [256], [0, 256])
         
-        # Normalize histograms
-        h_hist = cv2.normalize(h_hist, h_hist).flatten()
-        s_hist = cv2.normalize(s_hist, s_hist).flatten()
-        v_hist = cv2.normalize(v_hist, v_hist).flatten()
-        
-        # Calculate color moments
-        mean_h = np.mean(hsv[:,:,0])
-        std_h = np.std(hsv[:,:,0])
-        
-        mean_s = np.mean(hsv[:,:,1])
-        std_s = np.std(hsv[:,:,1])
+        # Normalize histograms straight to uint16 (unit L2 norm = 65535);
+        # small ints serialize far shorter than float64 reprs
+        h_hist = cv2.normalize(h_hist, None, _HIST_SCALE, 0, cv2.NORM_L2, dtype=cv2.CV_16U).ravel()
+        s_hist = cv2.normalize(s_hist, None, _HIST_SCALE, 0, cv2.NORM_L2, dtype=cv2.CV_16U).ravel()
+        v_hist = cv2.normalize(v_hist, None, _HIST_SCALE, 0, cv2.NORM_L2, dtype=cv2.CV_16U).ravel()
         
-        mean_v = np.mean(hsv[:,:,2])
-        std_v = np.std(hsv[:,:,2])
+        # Calculate color moments (all channels in one pass)
+        mean, std = cv2.meanStdDev(hsv)
+        mean_h, mean_s, mean_v = mean.ravel()
+        std_h, std_s, std_v = std.ravel()
         
         return {
             'histograms': {
@@ -238,11 +605,11 @@ class ImageProcessor:
                 'value': v_hist.tolist()
             },
             'moments': {
-                'hue_mean': float(mean_h),
-                'hue_std': float(std_h),
-                'saturation_mean': float(mean_s),
-                'saturation_std': float(std_s),
-                'value_mean': float(mean_v),
-                'value_std': float(std_v)
+                'hue_mean': round(float(mean_h), 3),
+                'hue_std': round(float(std_h), 3),
+                'saturation_mean': round(float(mean_s), 3),
+                'saturation_std': round(float(std_s), 3),
+                'value_mean': round(float(mean_v), 3),
+                'value_std': round(float(std_v), 3)
             }
         }
@@ -2,24 +2,25 @@
 Validation utilities for Mkulima AI
 """
 
-import magic
 from PIL import Image
-import io
 import re
 from typing import Dict, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Allowed image formats
-ALLOWED_MIME_TYPES = {
-    'image/jpeg',
-    'image/png',
-    'image/gif',
-    'image/bmp',
-    'image/webp'
+# Allowed image formats: MIME type -> Pillow format name
+ALLOWED_IMAGE_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/png': 'PNG',
+    'image/gif': 'GIF',
+    'image/bmp': 'BMP',
+    'image/webp': 'WEBP'
 }
 
+# Bytes needed by _sniff_mime
+_SNIFF_LENGTH = 12
+
 ALLOWED_EXTENSIONS = {
     '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'
 }
@@ -27,6 +28,57 @@ ALLOWED_EXTENSIONS = {
 # Phone number regex for Kenya
 KENYA_PHONE_REGEX = r'^(?:\+254|0)[17]\d{8}$'
 
+# Precompiled patterns
+_PHONE_RE = re.compile(KENYA_PHONE_REGEX)
+_PHONE_STRIP_RE = re.compile(r'[\s\-]')
+_EMAIL_RE = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+_CROP_INVALID_RE = re.compile(r'[^\w\s\-]')
+
+# Required fields, in the order missing ones are reported
+_FARMER_REQUIRED_FIELDS = ('name', 'phone_number', 'county')
+_PREDICTION_REQUIRED_FIELDS = ('disease_name', 'confidence', 'crop_type')
+_FARMER_REQUIRED = frozenset(_FARMER_REQUIRED_FIELDS)
+_PREDICTION_REQUIRED = frozenset(_PREDICTION_REQUIRED_FIELDS)
+
+def _sniff_mime(header: bytes):
+    """
+    Identify an allowed image type from its magic number
+    
+    Args:
+        header: First _SNIFF_LENGTH bytes of the file
+        
+    Returns:
+        MIME type, or None if the file is not an allowed image type
+    """
+    if header[:3] == b'\xff\xd8\xff':
+        return 'image/jpeg'
+    if header[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if header[:2] == b'BM':
+        return 'image/bmp'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+def _stream_size(stream) -> int:
+    """
+    Size in bytes of an uploaded file stream
+    
+    Seeking to the end is cheap for in-memory, spooled and disk-backed
+    streams alike and needs no private attributes.
+    
+    Args:
+        stream: File-like object, or a FileStorage wrapping one
+        
+    Returns:
+        Stream size in bytes
+    """
+    stream = getattr(stream, 'stream', stream)
+    stream.seek(0, 2)  # Seek to end
+    return stream.tell()
+
 def validate_image_file(image_file) -> Dict[str, bool]:
     """
     Validate uploaded image file
@@ -53,22 +105,20 @@ def validate_image_file(image_file) -> Dict[str, bool]:
                 'message': f'File type not allowed. Allowed types: {", ".join(ALLOWED_EXTENSIONS)}'
             }
         
-        # Read file content for MIME type validation
-        file_content = image_file.read()
-        image_file.seek(0)  # Reset file pointer
-        
-        # Check MIME type
-        mime_type = magic.from_buffer(file_content[:2048], mime=True)
-        if mime_type not in ALLOWED_MIME_TYPES:
+        # Check the magic number before handing the file to Pillow
+        image_file.seek(0)
+        mime_type = _sniff_mime(image_file.read(_SNIFF_LENGTH))
+        if mime_type is None:
             return {
                 'valid': False,
-                'message': f'Invalid file type: {mime_type}'
+                'message': 'Invalid file type: unknown'
             }
         
-        # Verify it's a valid image by trying to open it
+        # Parse the header only, with the one matching Pillow plugin;
+        # the size is read without decoding pixels
         try:
-            image = Image.open(io.BytesIO(file_content))
-            image.verify()  # Verify it's a valid image
+            image_file.seek(0)
+            image = Image.open(image_file, formats=[ALLOWED_IMAGE_FORMATS[mime_type]])
             
             # Check image dimensions
             width, height = image.size
@@ -85,8 +135,7 @@ def validate_image_file(image_file) -> Dict[str, bool]:
                 }
             
             # Check file size (16MB max)
-            image_file.seek(0, 2)  # Seek to end
-            file_size = image_file.tell()
+            file_size = _stream_size(image_file)
             image_file.seek(0)  # Reset to beginning
             
             if file_size > 16 * 1024 * 1024:  # 16MB
@@ -127,21 +176,21 @@ def validate_farmer_data(farmer_data: Dict) -> Tuple[bool, str]:
         Tuple of (is_valid, error_message)
     """
     try:
-        # Check required fields
-        required_fields = ['name', 'phone_number', 'county']
-        for field in required_fields:
-            if field not in farmer_data or not farmer_data[field]:
-                return False, f'Missing required field: {field}'
+        # Check required fields (present and non-empty)
+        if not (farmer_data.keys() >= _FARMER_REQUIRED
+                and all(farmer_data[field] for field in _FARMER_REQUIRED_FIELDS)):
+            field = next(f for f in _FARMER_REQUIRED_FIELDS if not farmer_data.get(f))
+            return False, f'Missing required field: {field}'
         
         # Validate phone number
         phone = str(farmer_data['phone_number']).strip()
-        if not re.match(KENYA_PHONE_REGEX, phone):
+        if not _PHONE_RE.match(phone):
             return False, 'Invalid Kenyan phone number format. Use format: +2547XXXXXXXX or 07XXXXXXXX'
         
         # Validate email if provided
         if 'email' in farmer_data and farmer_data['email']:
             email = farmer_data['email'].strip()
-            if not re.match(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$', email):
+            if not _EMAIL_RE.match(email):
                 return False, 'Invalid email address format'
         
         # Validate location data
@@ -222,10 +271,10 @@ def validate_prediction_data(prediction_data: Dict) -> Tuple[bool, str]:
     """
     try:
         # Check required fields
-        required_fields = ['disease_name', 'confidence', 'crop_type']
-        for field in required_fields:
-            if field not in prediction_data:
-                return False, f'Missing required field: {field}'
+        missing = _PREDICTION_REQUIRED - prediction_data.keys()
+        if missing:
+            field = next(f for f in _PREDICTION_REQUIRED_FIELDS if f in missing)
+            return False, f'Missing required field: {field}'
         
         # Validate confidence (0-1)
         confidence = prediction_data['confidence']
@@ -271,10 +320,10 @@ def validate_phone_number(phone: str) -> bool:
     phone = phone.strip()
     
     # Remove any spaces or dashes
-    phone = re.sub(r'[\s\-]', '', phone)
+    phone = _PHONE_STRIP_RE.sub('', phone)
     
     # Check if matches Kenyan phone pattern
-    return bool(re.match(KENYA_PHONE_REGEX, phone))
+    return bool(_PHONE_RE.match(phone))
 
 def validate_email(email: str) -> bool:
     """
@@ -292,8 +341,7 @@ def validate_email(email: str) -> bool:
     email = email.strip()
     
     # Simple email validation regex
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return bool(re.match(pattern, email))
+    return bool(_EMAIL_RE.match(email))
 
 def validate_crop_name(crop_name: str) -> Tuple[bool, str]:
     """
@@ -317,7 +365,7 @@ def validate_crop_name(crop_name: str) -> Tuple[bool, str]:
         return False, 'Crop name too long'
     
     # Check for invalid characters
-    if re.search(r'[^\w\s\-]', crop_name):
+    if _CROP_INVALID_RE.search(crop_name):
         return False, 'Crop name contains invalid characters'
     
     return True, 'Crop name is valid'
@@ -7,26 +7,380 @@ import os
 import numpy as np
 import pandas as pd
 import cv2
-from PIL import Image
 import albumentations as A
 from sklearn.model_selection import train_test_split
 import shutil
 from tqdm import tqdm
 import json
+from collections import Counter
+import tarfile
+import io
+import struct
+import random
+import zlib
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Threads for linking/copying files into splits (syscall-bound)
+COPY_THREADS = 32
+
+# Source images handed to an augmentation worker per dispatch
+AUGMENT_BATCH = 32
+
+# Samples per WebDataset shard (~1 GB of 224x224 JPEGs)
+SHARD_MAXCOUNT = 10000
+
+# Image file extensions, lowercased without the dot
+_IMG_EXTS = frozenset({'png', 'jpg', 'jpeg'})
+
+def _iter_image_entries(dirpath):
+    """
+    Yield the image files of a directory as os.DirEntry objects
+    
+    os.scandir returns the file type with each entry, so only symlinked
+    entries cost a stat (symlinked images are followed, like _class_dirs).
+    """
+    with os.scandir(dirpath) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.rpartition('.')[2].lower() in _IMG_EXTS:
+                yield entry
+
+def _class_dirs(root):
+    """
+    Sorted class directory names under root
+    
+    DirEntry.is_dir() uses the type returned with the directory listing,
+    so only symlinked entries cost a stat.
+    """
+    with os.scandir(root) as it:
+        return sorted(entry.name for entry in it if entry.is_dir())
+
+def _count_images(dirpath):
+    """Number of image files in a directory"""
+    return sum(1 for _ in _iter_image_entries(dirpath))
+
+# JPEG start-of-image magic and start-of-frame markers (all but DHT,
+# JPG and DAC in 0xC0-0xCF), for reading the size from the header
+_JPEG_MAGIC = b'\xff\xd8\xff'
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# DCT-domain reduced JPEG decodes, largest reduction first
+_REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _jpeg_size(data):
+    """
+    Read a JPEG's (width, height) from its frame header, or None if not found
+    
+    Walks the segment lengths only, so nothing is decoded.
+    """
+    i = 2
+    end = len(data) - 9
+    while i < end:
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+        elif marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack_from('>HH', data, i + 5)
+            return width, height
+        elif marker == 0x01 or 0xD0 <= marker <= 0xD8:  # Markers without a length
+            i += 2
+        else:
+            i += 2 + struct.unpack_from('>H', data, i + 2)[0]
+    
+    return None
+
+def _imread(image_path, target_size=None):
+    """
+    Read an image as BGR, decoding JPEGs at the smallest scale that covers target_size
+    
+    libjpeg can decode at 1/2, 1/4 or 1/8 scale inside the IDCT. The scale
+    is picked from the source size in the JPEG frame header, so every image
+    is decoded exactly once. Other formats are decoded in full.
+    
+    Args:
+        image_path: Image file path
+        target_size: Size the image will be resized to (width, height)
+    
+    Returns:
+        (BGR image array or None if the file can't be decoded,
+        source (width, height) or None if unknown)
+    """
+    if target_size is None or image_path.rpartition('.')[2].lower() not in ('jpg', 'jpeg'):
+        image = cv2.imread(image_path, cv2.IMREAD_COLOR)
+        return image, None if image is None else image.shape[1::-1]
+    
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    
+    source_size = _jpeg_size(data) if data[:3] == _JPEG_MAGIC else None
+    flag = cv2.IMREAD_COLOR
+    if source_size is not None:
+        width, height = source_size
+        # Reduced decodes round up, so a floor that covers the target is safe
+        for factor, reduced_flag in _REDUCED_READ_FLAGS:
+            if width // factor >= target_size[0] and height // factor >= target_size[1]:
+                flag = reduced_flag
+                break
+    
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if image is not None and source_size is None:
+        source_size = image.shape[1::-1]
+    
+    return image, source_size
+
+def _jpeg_codec():
+    """JPEG library line from OpenCV's build information, e.g. 'libjpeg-turbo (ver 2.1.3-62)'"""
+    for line in cv2.getBuildInformation().splitlines():
+        name, _, value = line.strip().partition(':')
+        if name.strip() == 'JPEG':
+            return value.strip()
+    return 'unknown'
+
+def build_augmentation_pipeline(target_size=None):
+    """
+    Build the augmentation pipeline used to balance classes
+    
+    Args:
+        target_size: Output image size (width, height); when given, the
+            pipeline ends with a resize so augmented images are written
+            at their final size
+    """
+    # Cheap pixel-wise transforms first, warps last. PiecewiseAffine
+    # (a per-pixel remap grid) is by far the slowest transform, so it is
+    # picked rarely within its OneOf
+    transforms = [
+        A.RandomRotate90(p=0.5),
+        A.Flip(p=0.5),
+        A.Transpose(p=0.5),
+        A.OneOf([
+            A.RandomBrightnessContrast(),
+            A.Sharpen(alpha=(0.2, 0.5), lightness=(0.5, 1.0)),
+            A.Emboss(alpha=(0.2, 0.5), strength=(0.2, 0.7)),
+            A.CLAHE(clip_limit=2),
+        ], p=0.3),
+        A.HueSaturationValue(p=0.3),
+        A.GaussNoise(p=0.2),
+        A.OneOf([
+            A.MotionBlur(p=0.2),
+            A.MedianBlur(blur_limit=3, p=0.1),
+            A.Blur(blur_limit=3, p=0.1),
+        ], p=0.2),
+        A.ShiftScaleRotate(shift_limit=0.0625, scale_limit=0.2, 
+                          rotate_limit=45, p=0.2),
+        A.OneOf([
+            A.OpticalDistortion(p=0.3),
+            A.GridDistortion(p=0.1),
+            A.PiecewiseAffine(p=0.05),
+        ], p=0.2),
+    ]
+    
+    if target_size is not None:
+        width, height = target_size
+        transforms.append(A.Resize(height, width, interpolation=cv2.INTER_AREA, p=1.0))
+    
+    return A.Compose(transforms)
+
+# Augmentation pipeline, output size and base seed of the current worker
+# process, see _init_worker
+_worker_pipeline = None
+_worker_target_size = None
+_worker_seed = None
+
+# Encoded images waiting for the worker's writer thread, and the paths
+# it failed to write
+_worker_write_queue = None
+_worker_write_failures = None
+
+# Encoded images buffered per worker before augmentation blocks on disk
+WRITE_QUEUE_SIZE = 64
+
+def _drain_writes(write_queue, failures):
+    """
+    Write (path, encoded image) pairs from write_queue to disk
+    
+    A failed write is reported and recorded in failures rather than
+    raised: the thread must keep draining, or the bounded queue fills
+    and the worker blocks forever.
+    """
+    while True:
+        path, data = write_queue.get()
+        try:
+            with open(path, 'wb') as f:
+                f.write(data)
+        except Exception as e:
+            print(f"Error writing {path}: {e}")
+            failures.append(path)
+        finally:
+            write_queue.task_done()
+
+def _init_worker(target_size, seed=None, opencv_threads=1):
+    """Build the augmentation pipeline and writer thread once per worker process"""
+    global _worker_pipeline, _worker_target_size, _worker_seed
+    global _worker_write_queue, _worker_write_failures
+    cv2.setNumThreads(opencv_threads)
+    _worker_pipeline = build_augmentation_pipeline(target_size)
+    _worker_target_size = target_size
+    _worker_seed = seed
+    
+    _worker_write_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    _worker_write_failures = []
+    threading.Thread(target=_drain_writes, args=(_worker_write_queue, _worker_write_failures),
+                     daemon=True).start()
+
+def _augmentation_seed(seed, image_path, index):
+    """
+    Stable per-augmentation seed, independent of worker and job order
+    
+    Uses crc32 rather than hash(), which is salted per process.
+    """
+    key = f"{seed}/{os.path.basename(os.path.dirname(image_path))}/{os.path.basename(image_path)}/{index}"
+    return zlib.crc32(key.encode())
+
+def _augment_one(job):
+    """
+    Write augmented copies of one image (runs in a worker process)
+    
+    Args:
+        job: (image_path, num_augmentations, start_index, class_dir); output
+            files are numbered from start_index so workers never collide
+    
+    Returns:
+        (number of augmented images written, paths that failed to write)
+    """
+    image_path, num_augmentations, start_index, class_dir = job
+    image_file = os.path.basename(image_path)
+    ext = os.path.splitext(image_file)[1]
+    
+    image, _ = _imread(image_path, _worker_target_size)
+    if image is None:
+        return 0, []
+    
+    queued = 0
+    
+    # The image stays BGR throughout: every transform in the pipeline is
+    # channel-order agnostic, and HueSaturationValue's symmetric hue shift
+    # has the same distribution with R and B swapped
+    
+    for i in range(num_augmentations):
+        # Albumentations draws from the global random/np.random state
+        if _worker_seed is not None:
+            seed = _augmentation_seed(_worker_seed, image_path, start_index + i)
+            random.seed(seed)
+            np.random.seed(seed)
+        
+        # Apply augmentations
+        augmented = _worker_pipeline(image=image)
+        aug_image = augmented['image']
+        
+        # Encode here, write on the writer thread so the next
+        # augmentation overlaps the disk write
+        aug_filename = f"aug_{start_index + i}_{image_file}"
+        aug_path = os.path.join(class_dir, aug_filename)
+        
+        ok, encoded = cv2.imencode(ext, aug_image)
+        if ok:
+            _worker_write_queue.put((aug_path, encoded))
+            queued += 1
+    
+    # Finish this job's writes before reporting it done; the writer is
+    # idle after join(), so its failures all belong to this job
+    _worker_write_queue.join()
+    failed = list(_worker_write_failures)
+    _worker_write_failures.clear()
+    
+    return queued - len(failed), failed
+
+def _link_or_copy(src_path, dst_path):
+    """
+    Hardlink src_path to dst_path, copying when linking is not possible
+    
+    The copy fallback (e.g. across filesystems) is shutil.copy2, which uses
+    os.sendfile on Linux so the bytes never pass through Python.
+    """
+    try:
+        os.link(src_path, dst_path)
+    except FileExistsError:
+        os.remove(dst_path)
+        _link_or_copy(src_path, dst_path)
+    except OSError:
+        shutil.copy2(src_path, dst_path)
+
+def _write_resized(image, dst_path, target_size):
+    """
+    Resize a decoded image and write it to dst_path
+    
+    The result is written to a new file and renamed into place, so an
+    existing dst_path hardlinked to the source dataset is never modified.
+    """
+    image = cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
+    
+    root, ext = os.path.splitext(dst_path)
+    tmp_path = f"{root}.resizing{ext}"
+    cv2.imwrite(tmp_path, image, [cv2.IMWRITE_JPEG_QUALITY, 95])
+    os.replace(tmp_path, dst_path)
+
+def _resize_one(image_path, target_size):
+    """
+    Resize one image file in place
+    
+    Args:
+        image_path: Path of the image to overwrite
+        target_size: Target image size (width, height)
+    """
+    image, _ = _imread(image_path, target_size)
+    if image is None:
+        return
+    
+    _write_resized(image, image_path, target_size)
+
+def _copy_resized(src_path, dst_path, target_size):
+    """
+    Copy an image into a split at target_size in a single read and write
+    
+    Images whose source is exactly target_size (e.g. augmented ones) and
+    images that fail to decode are linked/copied as they are. The check
+    uses the source size, not the decoded one: a reduced JPEG decode of a
+    2x/4x/8x larger image also comes out at target_size.
+    """
+    image, source_size = _imread(src_path, target_size)
+    if image is None or source_size == tuple(target_size):
+        _link_or_copy(src_path, dst_path)
+        return
+    
+    _write_resized(image, dst_path, target_size)
 
 class DataPreparer:
     """Prepares and augments plant disease image data"""
     
-    def __init__(self, source_dir, target_dir):
+    def __init__(self, source_dir, target_dir, num_workers=None, target_size=(224, 224), seed=None):
         """
         Initialize data preparer
         
         Args:
             source_dir: Source directory with raw images
             target_dir: Target directory for processed images
+            num_workers: Augmentation processes (default: CPU count)
+            target_size: Final image size (width, height), or None to keep
+                images at their original size
+            seed: Seed for reproducible augmentations, or None for random
         """
         self.source_dir = source_dir
         self.target_dir = target_dir
+        self.num_workers = num_workers or os.cpu_count()
+        self.target_size = target_size
+        self.seed = seed
+        
+        # Parallelize either across images (worker pools) or inside each
+        # OpenCV call, never both: nested pools oversubscribe the cores
+        self.opencv_threads = 1 if self.num_workers > 1 else (os.cpu_count() or 1)
+        cv2.setNumThreads(self.opencv_threads)
         
         # Create target directories
         self.train_dir = os.path.join(target_dir, 'train')
@@ -37,45 +391,20 @@ class DataPreparer:
             os.makedirs(dir_path, exist_ok=True)
         
         # Define augmentation pipeline
-        self.augmentation_pipeline = A.Compose([
-            A.RandomRotate90(p=0.5),
-            A.Flip(p=0.5),
-            A.Transpose(p=0.5),
-            A.OneOf([
-                A.IAAAdditiveGaussianNoise(),
-                A.GaussNoise(),
-            ], p=0.2),
-            A.OneOf([
-                A.MotionBlur(p=0.2),
-                A.MedianBlur(blur_limit=3, p=0.1),
-                A.Blur(blur_limit=3, p=0.1),
-            ], p=0.2),
-            A.ShiftScaleRotate(shift_limit=0.0625, scale_limit=0.2, 
-                              rotate_limit=45, p=0.2),
-            A.OneOf([
-                A.OpticalDistortion(p=0.3),
-                A.GridDistortion(p=0.1),
-                A.IAAPiecewiseAffine(p=0.3),
-            ], p=0.2),
-            A.OneOf([
-                A.CLAHE(clip_limit=2),
-                A.IAASharpen(),
-                A.IAAEmboss(),
-                A.RandomBrightnessContrast(),
-            ], p=0.3),
-            A.HueSaturationValue(p=0.3),
-        ])
+        self.augmentation_pipeline = build_augmentation_pipeline(target_size)
+        
+        # Class directories don't change during a run, see get_class_mapping
+        self._class_mapping = None
+        
+        # Split counts from save_split_info, used by print_summary
+        self._split_info = None
     
     def get_class_distribution(self):
         """Get distribution of classes in dataset"""
         class_counts = {}
         
-        for class_name in os.listdir(self.source_dir):
-            class_dir = os.path.join(self.source_dir, class_name)
-            if os.path.isdir(class_dir):
-                num_images = len([f for f in os.listdir(class_dir) 
-                                if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-                class_counts[class_name] = num_images
+        for class_name in _class_dirs(self.source_dir):
+            class_counts[class_name] = _count_images(os.path.join(self.source_dir, class_name))
         
         return class_counts
     
@@ -104,71 +433,77 @@ class DataPreparer:
         Args:
             class_name: Name of the class to augment
             num_augmentations: Number of augmented images to create
+            
+        Returns:
+            Paths of augmented images that could not be written
         """
         class_dir = os.path.join(self.source_dir, class_name)
-        image_files = [f for f in os.listdir(class_dir) 
-                      if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+        image_files = [entry.name for entry in _iter_image_entries(class_dir)]
         
         if not image_files:
             print(f"  No images found for class {class_name}")
-            return
-        
-        # Calculate how many augmentations per original image
-        aug_per_image = max(1, num_augmentations // len(image_files))
+            return []
+        
+        # Spread augmentations evenly at random over the source images;
+        # sorted so a seeded run assigns the same counts to the same files
+        image_files.sort()
+        rng = np.random.default_rng(None if self.seed is None else zlib.crc32(f"{self.seed}/{class_name}".encode()))
+        counts = rng.multinomial(num_augmentations, np.full(len(image_files), 1.0 / len(image_files)))
+        
+        # One job per source image, each with its own output index range
+        jobs = []
+        start_index = 0
+        for image_file, count in zip(image_files, counts):
+            if count:
+                jobs.append((os.path.join(class_dir, image_file), int(count), start_index, class_dir))
+                start_index += int(count)
         
         augmented_count = 0
-        for image_file in tqdm(image_files, desc=f"Augmenting {class_name}"):
-            if augmented_count >= num_augmentations:
-                break
-            
-            image_path = os.path.join(class_dir, image_file)
-            image = cv2.imread(image_path)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-            
-            for i in range(aug_per_image):
-                if augmented_count >= num_augmentations:
-                    break
-                
-                # Apply augmentations
-                augmented = self.augmentation_pipeline(image=image)
-                aug_image = augmented['image']
-                
-                # Save augmented image
-                aug_filename = f"aug_{augmented_count}_{image_file}"
-                aug_path = os.path.join(class_dir, aug_filename)
-                
-                aug_image_rgb = cv2.cvtColor(aug_image, cv2.COLOR_RGB2BGR)
-                cv2.imwrite(aug_path, aug_image_rgb)
-                
-                augmented_count += 1
+        failed_paths = []
+        with ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                 initargs=(self.target_size, self.seed, self.opencv_threads)) as executor:
+            for count, failed in tqdm(executor.map(_augment_one, jobs, chunksize=AUGMENT_BATCH),
+                                      total=len(jobs), desc=f"Augmenting {class_name}"):
+                augmented_count += count
+                failed_paths.extend(failed)
         
         print(f"  Created {augmented_count} augmented images for {class_name}")
+        if failed_paths:
+            print(f"  Failed to write {len(failed_paths)} augmented images for {class_name}")
+        
+        return failed_paths
     
-    def prepare_train_val_test_split(self, val_ratio=0.15, test_ratio=0.15):
+    def prepare_train_val_test_split(self, val_ratio=0.15, test_ratio=0.15, target_size=None,
+                                     shards=False):
         """
         Split data into train, validation, and test sets
         
         Args:
             val_ratio: Validation set ratio
             test_ratio: Test set ratio
+            target_size: Resize images to (width, height) while copying
+            shards: Also pack each split into WebDataset shards
         """
         print("Splitting dataset...")
         
         all_images = []
-        all_labels = []
+        class_counts = []
         
-        # Collect all images and labels
-        for class_idx, class_name in enumerate(os.listdir(self.source_dir)):
+        # Collect all images; labels follow get_class_mapping() so they
+        # match the saved class mapping
+        class_mapping = self.get_class_mapping()
+        for class_name in class_mapping:
             class_dir = os.path.join(self.source_dir, class_name)
-            if not os.path.isdir(class_dir):
-                continue
             
-            image_files = [f for f in os.listdir(class_dir) 
-                          if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-            
-            for image_file in image_files:
-                all_images.append(os.path.join(class_name, image_file))
-                all_labels.append(class_idx)
+            num_before = len(all_images)
+            all_images.extend(os.path.join(class_name, entry.name)
+                              for entry in _iter_image_entries(class_dir))
+            class_counts.append(len(all_images) - num_before)
+        
+        # Contiguous arrays: one int32 label per image, built per class
+        all_images = np.asarray(all_images, dtype=object)
+        all_labels = np.repeat(np.fromiter(class_mapping.values(), dtype=np.int32),
+                               class_counts)
         
         print(f"Total images: {len(all_images)}")
         
@@ -190,36 +525,92 @@ class DataPreparer:
         print(f"Test set: {len(test_images)} images")
         
         # Copy images to respective directories
-        self.copy_images_to_split(train_images, 'train')
-        self.copy_images_to_split(val_images, 'val')
-        self.copy_images_to_split(test_images, 'test')
+        self.copy_images_to_split(train_images, 'train', target_size)
+        self.copy_images_to_split(val_images, 'val', target_size)
+        self.copy_images_to_split(test_images, 'test', target_size)
+        
+        # Pack splits into shards (train_test_split already shuffled them)
+        if shards:
+            self.write_shards(train_images, 'train')
+            self.write_shards(val_images, 'val')
+            self.write_shards(test_images, 'test')
         
         # Save split information
         self.save_split_info(train_images, val_images, test_images)
     
-    def copy_images_to_split(self, image_paths, split_name):
+    def copy_images_to_split(self, image_paths, split_name, target_size=None):
         """
         Copy images to split directory
         
+        Images are hardlinked (no bytes copied) when the split lives on the
+        same filesystem as the source, and copied otherwise. With a
+        target_size, images are resized on the way instead of in a second
+        pass over the split.
+        
         Args:
             image_paths: List of image paths
             split_name: 'train', 'val', or 'test'
+            target_size: Resize images to (width, height), or None to copy
         """
         split_dir = getattr(self, f'{split_name}_dir')
         
-        for rel_path in tqdm(image_paths, desc=f"Copying {split_name} images"):
-            class_name, image_file = os.path.split(rel_path)
-            
-            # Create class directory in split
-            class_split_dir = os.path.join(split_dir, class_name)
-            os.makedirs(class_split_dir, exist_ok=True)
-            
-            # Source and destination paths
+        # Create class directories in split
+        for class_name in {os.path.dirname(rel_path) for rel_path in image_paths}:
+            os.makedirs(os.path.join(split_dir, class_name), exist_ok=True)
+        
+        def link_image(rel_path):
             src_path = os.path.join(self.source_dir, rel_path)
-            dst_path = os.path.join(class_split_dir, image_file)
-            
-            # Copy image
-            shutil.copy2(src_path, dst_path)
+            dst_path = os.path.join(split_dir, rel_path)
+            if target_size is None:
+                _link_or_copy(src_path, dst_path)
+            else:
+                _copy_resized(src_path, dst_path, target_size)
+        
+        with ThreadPoolExecutor(max_workers=COPY_THREADS) as executor:
+            list(tqdm(executor.map(link_image, image_paths),
+                      total=len(image_paths), desc=f"Copying {split_name} images"))
+    
+    def write_shards(self, image_paths, split_name, maxcount=SHARD_MAXCOUNT):
+        """
+        Pack a split into WebDataset tar shards
+        
+        Each sample is a '<key>.jpg' (or '.png') entry plus a '<key>.cls'
+        entry holding the class index, so loaders read a few large files
+        sequentially instead of seeking across one file per image.
+        
+        Args:
+            image_paths: List of image paths, relative to the split directory
+            split_name: 'train', 'val', or 'test'
+            maxcount: Samples per shard
+        """
+        split_dir = getattr(self, f'{split_name}_dir')
+        shard_dir = os.path.join(self.target_dir, 'shards')
+        os.makedirs(shard_dir, exist_ok=True)
+        
+        class_mapping = self.get_class_mapping()
+        shard = None
+        
+        try:
+            for i, rel_path in enumerate(tqdm(image_paths, desc=f"Sharding {split_name} images")):
+                if i % maxcount == 0:
+                    if shard is not None:
+                        shard.close()
+                    shard_path = os.path.join(shard_dir, f"{split_name}-{i // maxcount:06d}.tar")
+                    shard = tarfile.open(shard_path, 'w')
+                
+                class_name, image_file = os.path.split(rel_path)
+                key = f"{class_name}_{i:08d}"
+                ext = image_file.rpartition('.')[2].lower().replace('jpeg', 'jpg')
+                
+                shard.add(os.path.join(split_dir, rel_path), arcname=f"{key}.{ext}")
+                
+                label = str(class_mapping[class_name]).encode()
+                info = tarfile.TarInfo(f"{key}.cls")
+                info.size = len(label)
+                shard.addfile(info, io.BytesIO(label))
+        finally:
+            if shard is not None:
+                shard.close()
     
     def save_split_info(self, train_images, val_images, test_images):
         """Save information about the split"""
@@ -229,26 +620,37 @@ class DataPreparer:
             'test_count': len(test_images),
             'total_count': len(train_images) + len(val_images) + len(test_images),
             'class_mapping': self.get_class_mapping(),
-            'train_samples': train_images[:100],  # Save first 100 for reference
-            'val_samples': val_images[:50],
-            'test_samples': test_images[:50]
+            'train_per_class': self._count_per_class(train_images),
+            'val_per_class': self._count_per_class(val_images),
+            'test_per_class': self._count_per_class(test_images),
+            'train_samples': list(train_images[:100]),  # Save first 100 for reference
+            'val_samples': list(val_images[:50]),
+            'test_samples': list(test_images[:50])
         }
         
         info_path = os.path.join(self.target_dir, 'split_info.json')
         with open(info_path, 'w') as f:
             json.dump(split_info, f, indent=2)
         
+        self._split_info = split_info
         print(f"Split information saved to {info_path}")
     
+    @staticmethod
+    def _count_per_class(image_paths):
+        """Count split images per class from their relative paths"""
+        return dict(sorted(Counter(os.path.dirname(p) for p in image_paths).items()))
+    
     def get_class_mapping(self):
-        """Get mapping from class names to indices"""
+        """Get mapping from class names to indices (computed once per run)"""
+        if self._class_mapping is not None:
+            return self._class_mapping
+        
         class_mapping = {}
         
-        for idx, class_name in enumerate(sorted(os.listdir(self.source_dir))):
-            class_dir = os.path.join(self.source_dir, class_name)
-            if os.path.isdir(class_dir):
-                class_mapping[class_name] = idx
+        for idx, class_name in enumerate(_class_dirs(self.source_dir)):
+            class_mapping[class_name] = idx
         
+        self._class_mapping = class_mapping
         return class_mapping
     
     def resize_images(self, target_size=(224, 224)):
@@ -261,41 +663,44 @@ class DataPreparer:
         print(f"Resizing images to {target_size}...")
         
         for split_dir in [self.train_dir, self.val_dir, self.test_dir]:
-            for class_name in os.listdir(split_dir):
+            for class_name in _class_dirs(split_dir):
                 class_dir = os.path.join(split_dir, class_name)
-                if not os.path.isdir(class_dir):
-                    continue
                 
-                for image_file in tqdm(os.listdir(class_dir), 
-                                     desc=f"Resizing {os.path.basename(split_dir)}/{class_name}"):
-                    if not image_file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        continue
-                    
-                    image_path = os.path.join(class_dir, image_file)
-                    
-                    # Open and resize image
-                    image = Image.open(image_path)
-                    image = image.resize(target_size, Image.Resampling.LANCZOS)
-                    
-                    # Save back (overwrite)
-                    image.save(image_path)
-    
-    def run(self, balance=True, resize=True):
+                image_paths = [entry.path for entry in _iter_image_entries(class_dir)]
+                
+                # OpenCV releases the GIL while decoding, resizing and encoding
+                with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+                    list(tqdm(executor.map(lambda path: _resize_one(path, target_size), image_paths),
+                              total=len(image_paths),
+                              desc=f"Resizing {os.path.basename(split_dir)}/{class_name}"))
+    
+    def run(self, balance=True, resize=True, shards=False):
         """Run complete data preparation pipeline"""
         print("=" * 50)
         print("Mkulima AI Data Preparation")
         print("=" * 50)
         
+        # All decoding/encoding goes through OpenCV; the scalar libjpeg is
+        # 2-4x slower than libjpeg-turbo on these codec-bound steps
+        jpeg_codec = _jpeg_codec()
+        print(f"OpenCV JPEG codec: {jpeg_codec}")
+        if 'turbo' not in jpeg_codec:
+            print("  Warning: libjpeg-turbo not detected; JPEG decode/encode will be slower")
+        
+        # Each source image is read at most twice (once if it is not
+        # augmented): by its augmentation job and by the split copy, which
+        # resizes on the way or hardlinks. A pre-loaded byte cache would
+        # add a full read and write of the dataset to save one read.
+        
         # Balance dataset if requested
         if balance:
             self.balance_dataset(target_samples_per_class=1000)
         
-        # Split data
-        self.prepare_train_val_test_split(val_ratio=0.15, test_ratio=0.15)
-        
-        # Resize images if requested
-        if resize:
-            self.resize_images(target_size=(224, 224))
+        # Split data, resizing while copying if requested (augmented
+        # images are already written at target size)
+        target_size = self.target_size if resize else None
+        self.prepare_train_val_test_split(val_ratio=0.15, test_ratio=0.15,
+                                          target_size=target_size, shards=shards)
         
         print("\nData preparation completed successfully!")
         
@@ -303,38 +708,27 @@ class DataPreparer:
         self.print_summary()
     
     def print_summary(self):
-        """Print dataset summary"""
+        """Print dataset summary from the split counts (no directory walk)"""
+        split_info = self._split_info
+        if split_info is None:
+            with open(os.path.join(self.target_dir, 'split_info.json')) as f:
+                split_info = json.load(f)
+        
         print("\nDataset Summary:")
         print("-" * 30)
         
-        total_train = 0
-        total_val = 0
-        total_test = 0
-        
-        for split_name, split_dir in [('Train', self.train_dir), 
-                                     ('Validation', self.val_dir), 
-                                     ('Test', self.test_dir)]:
+        for split_name, key in [('Train', 'train'), 
+                                ('Validation', 'val'), 
+                                ('Test', 'test')]:
             print(f"\n{split_name} Set:")
             
-            for class_name in sorted(os.listdir(split_dir)):
-                class_dir = os.path.join(split_dir, class_name)
-                if os.path.isdir(class_dir):
-                    num_images = len([f for f in os.listdir(class_dir) 
-                                    if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-                    
-                    print(f"  {class_name}: {num_images} images")
-                    
-                    if split_name == 'Train':
-                        total_train += num_images
-                    elif split_name == 'Validation':
-                        total_val += num_images
-                    elif split_name == 'Test':
-                        total_test += num_images
-        
-        print(f"\nTotal Train Images: {total_train}")
-        print(f"Total Validation Images: {total_val}")
-        print(f"Total Test Images: {total_test}")
-        print(f"Total Dataset Size: {total_train + total_val + total_test}")
+            for class_name, num_images in split_info[f'{key}_per_class'].items():
+                print(f"  {class_name}: {num_images} images")
+        
+        print(f"\nTotal Train Images: {split_info['train_count']}")
+        print(f"Total Validation Images: {split_info['val_count']}")
+        print(f"Total Test Images: {split_info['test_count']}")
+        print(f"Total Dataset Size: {split_info['total_count']}")
 
 def main():
     """Main function"""
@@ -349,12 +743,19 @@ def main():
                        help='Balance dataset by augmenting minority classes')
     parser.add_argument('--no-resize', action='store_false', dest='resize',
                        help='Do not resize images')
+    parser.add_argument('--shards', action='store_true',
+                       help='Also pack each split into WebDataset tar shards')
+    parser.add_argument('--seed', type=int, default=None,
+                       help='Seed for reproducible augmentations')
+    parser.add_argument('--workers', type=int, default=None,
+                       help='Augmentation worker processes (default: CPU count)')
     
     args = parser.parse_args()
     
     # Initialize and run data preparer
-    preparer = DataPreparer(args.source, args.target)
-    preparer.run(balance=args.balance, resize=args.resize)
+    preparer = DataPreparer(args.source, args.target, num_workers=args.workers,
+                            target_size=(224, 224) if args.resize else None, seed=args.seed)
+    preparer.run(balance=args.balance, resize=args.resize, shards=args.shards)
 
 if __name__ == '__main__':
     main()
@@ -4,25 +4,108 @@ Trains plant disease detection model using TensorFlow/Keras
 """
 
 import os
+import io
 import numpy as np
-import pandas as pd
 import tensorflow as tf
 from tensorflow import keras
-from tensorflow.keras import layers, models, applications
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.model_selection import train_test_split
-import cv2
+from tensorflow.keras import layers, applications
 import json
+import hashlib
 from datetime import datetime
-import mlflow
-import mlflow.tensorflow
 import argparse
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
 # Set random seeds for reproducibility
 np.random.seed(42)
 tf.random.set_seed(42)
 
+class AsyncCheckpoint(keras.callbacks.Callback):
+    """
+    Save the best weights without blocking the training loop
+    
+    The weights are copied to host memory at the end of the epoch and
+    serialized into an in-memory buffer; a background thread then writes
+    it with a single write() and an atomic rename, so a crash mid-write
+    never leaves a truncated checkpoint.
+    """
+    
+    def __init__(self, filepath, monitor='val_accuracy', save_best_only=True):
+        super().__init__()
+        self.filepath = filepath
+        self.monitor = monitor
+        self.save_best_only = save_best_only
+        self.best = -np.inf
+        self._executor = None
+    
+    def on_train_begin(self, logs=None):
+        # One writer per fit() call; the best score carries over, so a
+        # later training phase only saves if it beats the earlier one
+        self._executor = ThreadPoolExecutor(max_workers=1)
+    
+    def on_epoch_end(self, epoch, logs=None):
+        current = (logs or {}).get(self.monitor)
+        if self.save_best_only:
+            if current is None or current <= self.best:
+                return
+            print(f"\nEpoch {epoch + 1}: {self.monitor} improved from "
+                  f"{self.best:.5f} to {current:.5f}, saving checkpoint")
+            self.best = current
+        
+        # Snapshot now; the model keeps training while the write runs
+        weights = self.model.get_weights()
+        self._executor.submit(self._write, weights)
+    
+    def on_train_end(self, logs=None):
+        # Make sure the last checkpoint is on disk before evaluation
+        self._executor.shutdown(wait=True)
+    
+    def _write(self, weights):
+        buffer = io.BytesIO()
+        np.savez(buffer, *weights)
+        
+        tmp_path = self.filepath + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getbuffer())
+        os.replace(tmp_path, self.filepath)
+
+class MlflowBatchLogger(keras.callbacks.Callback):
+    """
+    Log epoch metrics to MLflow in batches
+    
+    Every logging call is a synchronous HTTP request to the tracking
+    server; buffering epochs and sending them with one log_batch call
+    keeps the network off the training loop's critical path.
+    """
+    
+    def __init__(self, flush_every=5):
+        super().__init__()
+        self.flush_every = flush_every
+        self._buffer = []
+    
+    def on_epoch_end(self, epoch, logs=None):
+        from mlflow.entities import Metric
+        
+        timestamp = int(datetime.now().timestamp() * 1000)
+        self._buffer.extend(
+            Metric(key, float(value), timestamp, epoch)
+            for key, value in (logs or {}).items()
+        )
+        if (epoch + 1) % self.flush_every == 0:
+            self._flush()
+    
+    def on_train_end(self, logs=None):
+        self._flush()
+    
+    def _flush(self):
+        import mlflow
+        from mlflow.tracking import MlflowClient
+        
+        run = mlflow.active_run()
+        if self._buffer and run is not None:
+            MlflowClient().log_batch(run.info.run_id, metrics=self._buffer)
+        self._buffer = []
+
 class PlantDiseaseModel:
     """Plant Disease Detection Model Trainer"""
     
@@ -37,12 +120,30 @@ class PlantDiseaseModel:
         self.model = None
         self.history = None
         self.class_names = []
+        self.base_model = None
+        self.strategy = tf.distribute.get_strategy()
+        self.num_replicas = 1
+        self.class_weight = None
+        self.steps_per_epoch = None
+        self.calibration_ds = None
         
         # Setup directories
         self.setup_directories()
         
+        # Mixed precision: float16 compute on Tensor Cores, float32 weights.
+        # Only worthwhile on a GPU; on CPU float16 math is emulated
+        self.mixed_precision = (self.config['training']['mixed_precision']
+                                and bool(tf.config.list_physical_devices('GPU')))
+        if self.mixed_precision:
+            keras.mixed_precision.set_global_policy('mixed_float16')
+        
         # Setup MLflow
+        # Plotting and tracking libraries are imported where they're used,
+        # so they don't add to startup time when disabled
         if self.config['tracking']['use_mlflow']:
+            import mlflow
+            # Background logging where supported (MLflow >= 2.8)
+            os.environ.setdefault('MLFLOW_ENABLE_ASYNC_LOGGING', 'true')
             mlflow.set_tracking_uri(self.config['tracking']['mlflow_uri'])
             mlflow.set_experiment(self.config['experiment_name'])
     
@@ -56,7 +157,11 @@ class PlantDiseaseModel:
                 'image_size': (224, 224),
                 'batch_size': 32,
                 'validation_split': 0.2,
-                'test_split': 0.1
+                'test_split': 0.1,
+                'shuffle_buffer': 2048,
+                'cache_dir': '../cache',  # None caches decoded images in memory
+                'tfrecord_dir': '../datasets/tfrecords',  # Used once build_tfrecords has run
+                'use_dali': False  # GPU JPEG decode for training (needs nvidia-dali)
             },
             'model': {
                 'base_model': 'MobileNetV2',
@@ -70,7 +175,12 @@ class PlantDiseaseModel:
                 'early_stopping_patience': 10,
                 'reduce_lr_patience': 5,
                 'use_augmentation': True,
-                'use_class_weights': True
+                'use_class_weights': True,
+                'mixed_precision': True,
+                'head_epochs': 5,  # Frozen-base warmup before fine-tuning
+                'fine_tune_layers': 30,  # Top base layers unfrozen afterwards
+                'fine_tune_learning_rate': 1e-5,
+                'jit_compile': True
             },
             'augmentation': {
                 'rotation_range': 40,
@@ -81,13 +191,16 @@ class PlantDiseaseModel:
                 'horizontal_flip': True,
                 'vertical_flip': False,
                 'brightness_range': [0.8, 1.2],
+                'contrast_range': 0.2,
                 'fill_mode': 'nearest'
             },
             'tracking': {
                 'use_mlflow': True,
                 'mlflow_uri': 'http://localhost:5000',
                 'save_checkpoints': True,
-                'save_best_only': True
+                'save_best_only': True,
+                'mlflow_log_every': 5,  # Epochs buffered per MLflow request
+                'tb_histogram_freq': 0  # Epochs between weight histograms (0 = off)
             },
             'paths': {
                 'models_dir': '../models',
@@ -124,71 +237,441 @@ class PlantDiseaseModel:
         
         dataset_path = self.config['data']['dataset_path']
         image_size = self.config['data']['image_size']
-        batch_size = self.config['data']['batch_size']
-        
-        # Create data generators
-        if self.config['training']['use_augmentation']:
-            train_datagen = keras.preprocessing.image.ImageDataGenerator(
-                rescale=1./255,
-                rotation_range=self.config['augmentation']['rotation_range'],
-                width_shift_range=self.config['augmentation']['width_shift_range'],
-                height_shift_range=self.config['augmentation']['height_shift_range'],
-                shear_range=self.config['augmentation']['shear_range'],
-                zoom_range=self.config['augmentation']['zoom_range'],
-                horizontal_flip=self.config['augmentation']['horizontal_flip'],
-                vertical_flip=self.config['augmentation']['vertical_flip'],
-                brightness_range=self.config['augmentation']['brightness_range'],
-                fill_mode=self.config['augmentation']['fill_mode'],
-                validation_split=self.config['data']['validation_split']
-            )
+        tfrecord_dir = self.config['data']['tfrecord_dir']
+        
+        if tfrecord_dir and os.path.exists(os.path.join(tfrecord_dir, 'shards.json')):
+            # Packed shards: large sequential reads instead of one open()
+            # per image (build them once with build_tfrecords)
+            with open(os.path.join(tfrecord_dir, 'shards.json')) as f:
+                shard_info = json.load(f)
+            self.class_names = shard_info['classes']
+            counts = shard_info['counts']
+            class_counts = np.array(shard_info['class_counts'])
+            cache_keys = shard_info['file_hashes']
+            splits = None
+            encoded = {
+                subset: self.read_tfrecords(tfrecord_dir, subset)
+                for subset in ('train', 'val', 'test')
+            }
         else:
-            train_datagen = keras.preprocessing.image.ImageDataGenerator(
-                rescale=1./255,
-                validation_split=self.config['data']['validation_split']
+            # List files once in Python; reading happens in parallel inside
+            # tf.data (no PIL, no Python loop)
+            splits, self.class_names = self.split_files(dataset_path)
+            counts = {subset: len(paths) for subset, (paths, _) in splits.items()}
+            class_counts = np.bincount(splits['train'][1], minlength=len(self.class_names))
+            cache_keys = {subset: self.file_list_hash(paths) for subset, (paths, _) in splits.items()}
+            encoded = {
+                subset: tf.data.Dataset.from_tensor_slices((paths, labels)).map(
+                    lambda path, label: (tf.io.read_file(path), label),
+                    num_parallel_calls=tf.data.AUTOTUNE
+                )
+                for subset, (paths, labels) in splits.items()
+            }
+        
+        print(f"Found {len(self.class_names)} classes: {self.class_names}")
+        print(f"Training samples: {counts['train']}")
+        print(f"Validation samples: {counts['val']}")
+        print(f"Test samples: {counts['test']}")
+        
+        # Balanced class weights from the training counts, computed once
+        # here rather than at fit time
+        if self.config['training']['use_class_weights']:
+            self.class_weight = self.compute_class_weights(class_counts)
+        
+        num_classes = len(self.class_names)
+        
+        def decode(contents, label):
+            return self.decode_and_resize(contents, image_size), tf.one_hot(label, num_classes)
+        
+        # Optionally decode training images on the GPU (file lists only)
+        train_ds = None
+        if self.config['data']['use_dali'] and splits is not None:
+            train_ds = self.build_dali_dataset(*splits['train'], num_classes)
+        if train_ds is None:
+            train_ds = self.prepare_dataset(
+                encoded['train'].map(decode, num_parallel_calls=tf.data.AUTOTUNE),
+                'train', cache_keys['train'], training=True
             )
+        val_ds = self.prepare_dataset(
+            encoded['val'].map(decode, num_parallel_calls=tf.data.AUTOTUNE),
+            'val', cache_keys['val']
+        )
+        # Host-side, unbatched [0, 1] validation images for INT8
+        # calibration in save_model; val_ds can't serve, since it may end
+        # in prefetch_to_device
+        self.calibration_ds = encoded['val'].map(decode, num_parallel_calls=tf.data.AUTOTUNE).map(
+            lambda image, label: (tf.cast(image, tf.float32) / 255.0, label)
+        )
         
-        # For validation and test, only rescale
-        val_datagen = keras.preprocessing.image.ImageDataGenerator(
-            rescale=1./255,
-            validation_split=self.config['data']['validation_split']
+        # Held out from both training and model selection; evaluated once,
+        # so there is nothing to gain from caching it
+        test_ds = self.prepare_dataset(
+            encoded['test'].map(decode, num_parallel_calls=tf.data.AUTOTUNE),
+            'test', cache_keys['test'], cache=False
         )
         
-        # Load training data
-        train_ds = train_datagen.flow_from_directory(
-            dataset_path,
-            target_size=image_size,
-            batch_size=batch_size,
-            class_mode='categorical',
-            subset='training',
-            seed=42
+        return train_ds, val_ds, test_ds
+    
+    @staticmethod
+    def list_image_files(dataset_path):
+        """
+        List image files under one sub-directory per class
+        
+        Args:
+            dataset_path: Root directory with one folder per class
+            
+        Returns:
+            file_paths, labels, class_names: Path and int label arrays
+            and the sorted class names (label i is class_names[i])
+        """
+        class_names = sorted(
+            entry.name for entry in os.scandir(dataset_path) if entry.is_dir()
         )
         
-        # Load validation data
-        val_ds = val_datagen.flow_from_directory(
-            dataset_path,
-            target_size=image_size,
-            batch_size=batch_size,
-            class_mode='categorical',
-            subset='validation',
-            seed=42
+        file_paths, labels = [], []
+        for label, class_name in enumerate(class_names):
+            class_dir = os.path.join(dataset_path, class_name)
+            for file_name in sorted(os.listdir(class_dir)):
+                if file_name.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')):
+                    file_paths.append(os.path.join(class_dir, file_name))
+                    labels.append(label)
+        
+        return np.array(file_paths), np.array(labels, dtype=np.int32), class_names
+    
+    @staticmethod
+    def compute_class_weights(class_counts):
+        """
+        Weight each class inversely to its frequency
+        
+        Same formula as sklearn's 'balanced': total / (num_classes * count).
+        
+        Args:
+            class_counts: Number of training images per class
+            
+        Returns:
+            Dict mapping class index to weight, as expected by model.fit
+        """
+        total = class_counts.sum()
+        num_classes = len(class_counts)
+        
+        # Keras needs a weight for every class; empty classes get 1.0
+        return {
+            i: float(total / (num_classes * count)) if count else 1.0
+            for i, count in enumerate(class_counts)
+        }
+    
+    @staticmethod
+    def file_list_hash(file_paths):
+        """
+        Short fingerprint of a split's file list
+        
+        Args:
+            file_paths: Image paths of one split
+            
+        Returns:
+            12-character hex digest, independent of the paths' order
+        """
+        digest = hashlib.sha1('\n'.join(sorted(file_paths)).encode())
+        return digest.hexdigest()[:12]
+    
+    def split_files(self, dataset_path):
+        """
+        Split the image files into training, validation and test sets
+        
+        Args:
+            dataset_path: Root directory with one folder per class
+            
+        Returns:
+            splits, class_names: {'train'|'val'|'test': (file_paths, labels)}
+            and the sorted class names
+        """
+        file_paths, labels, class_names = self.list_image_files(dataset_path)
+        
+        # One seeded shuffle, then hold out test_split and validation_split
+        # so the three sets never overlap
+        order = np.random.RandomState(42).permutation(len(file_paths))
+        num_test = int(len(file_paths) * self.config['data']['test_split'])
+        num_val = int(len(file_paths) * self.config['data']['validation_split'])
+        test_idx = order[:num_test]
+        val_idx = order[num_test:num_test + num_val]
+        train_idx = order[num_test + num_val:]
+        
+        splits = {
+            'train': (file_paths[train_idx], labels[train_idx]),
+            'val': (file_paths[val_idx], labels[val_idx]),
+            'test': (file_paths[test_idx], labels[test_idx])
+        }
+        return splits, class_names
+    
+    def build_tfrecords(self, shard_size_mb=256):
+        """
+        Pack the dataset into TFRecord shards (one-time step)
+        
+        Each record holds the original encoded image bytes and its label,
+        so shards cost no more disk than the source files and decoding
+        options stay in load_dataset.
+        
+        Args:
+            shard_size_mb: Approximate size of each shard in MB
+        """
+        tfrecord_dir = self.config['data']['tfrecord_dir']
+        os.makedirs(tfrecord_dir, exist_ok=True)
+        
+        splits, class_names = self.split_files(self.config['data']['dataset_path'])
+        shard_bytes = shard_size_mb * 1024 * 1024
+        
+        for subset, (file_paths, labels) in splits.items():
+            print(f"Writing {subset} shards...")
+            shard_index, written, writer = 0, 0, None
+            
+            for path, label in zip(file_paths, labels):
+                if writer is None:
+                    shard_path = os.path.join(tfrecord_dir, f"{subset}-{shard_index:05d}.tfrec")
+                    writer = tf.io.TFRecordWriter(shard_path)
+                
+                with open(path, 'rb') as f:
+                    contents = f.read()
+                example = tf.train.Example(features=tf.train.Features(feature={
+                    'img': tf.train.Feature(bytes_list=tf.train.BytesList(value=[contents])),
+                    'label': tf.train.Feature(int64_list=tf.train.Int64List(value=[int(label)]))
+                }))
+                writer.write(example.SerializeToString())
+                written += len(contents)
+                
+                if written >= shard_bytes:
+                    writer.close()
+                    shard_index, written, writer = shard_index + 1, 0, None
+            
+            if writer is not None:
+                writer.close()
+        
+        # Written last: load_dataset only switches to the shards once complete
+        shard_info = {
+            'classes': class_names,
+            'counts': {subset: len(paths) for subset, (paths, _) in splits.items()},
+            'class_counts': np.bincount(splits['train'][1], minlength=len(class_names)).tolist(),
+            'file_hashes': {subset: self.file_list_hash(paths) for subset, (paths, _) in splits.items()}
+        }
+        with open(os.path.join(tfrecord_dir, 'shards.json'), 'w') as f:
+            json.dump(shard_info, f, indent=2)
+        print(f"TFRecord shards saved: {tfrecord_dir}")
+    
+    @staticmethod
+    def read_tfrecords(tfrecord_dir, subset):
+        """
+        Read one split's TFRecord shards
+        
+        Args:
+            tfrecord_dir: Directory written by build_tfrecords
+            subset: 'train' or 'val'
+            
+        Returns:
+            Unbatched dataset of (encoded image bytes, int label)
+        """
+        files = sorted(tf.io.gfile.glob(os.path.join(tfrecord_dir, f"{subset}-*.tfrec")))
+        feature_spec = {
+            'img': tf.io.FixedLenFeature([], tf.string),
+            'label': tf.io.FixedLenFeature([], tf.int64)
+        }
+        
+        def parse(record):
+            example = tf.io.parse_single_example(record, feature_spec)
+            return example['img'], tf.cast(example['label'], tf.int32)
+        
+        ds = tf.data.Dataset.from_tensor_slices(files).interleave(
+            tf.data.TFRecordDataset,
+            cycle_length=8,
+            num_parallel_calls=tf.data.AUTOTUNE
         )
+        return ds.map(parse, num_parallel_calls=tf.data.AUTOTUNE)
+    
+    @staticmethod
+    def decode_and_resize(contents, image_size):
+        """
+        Decode and resize one encoded image to uint8
         
-        # Get class names
-        self.class_names = list(train_ds.class_indices.keys())
-        print(f"Found {len(self.class_names)} classes: {self.class_names}")
-        print(f"Training samples: {train_ds.samples}")
-        print(f"Validation samples: {val_ds.samples}")
+        JPEGs use the fast integer IDCT without fancy chroma upsampling:
+        fewer decoder operations, and the difference is lost in the
+        resize to the network input size anyway.
+        
+        Args:
+            contents: Scalar string tensor with the encoded image bytes
+            image_size: (height, width) target size
+            
+        Returns:
+            uint8 image tensor of shape (height, width, 3)
+        """
+        image = tf.cond(
+            tf.io.is_jpeg(contents),
+            lambda: tf.io.decode_jpeg(contents, channels=3, dct_method='INTEGER_FAST',
+                                      fancy_upscaling=False),
+            lambda: tf.io.decode_image(contents, channels=3, expand_animations=False)
+        )
+        image = tf.image.resize(image, image_size, method='bilinear', antialias=False)
+        image.set_shape((*image_size, 3))
         
-        # Create test dataset (you might need a separate test directory)
-        # For now, we'll use part of validation as test
-        total_samples = train_ds.samples + val_ds.samples
-        test_split = self.config['data']['test_split']
-        test_size = int(total_samples * test_split)
+        # Stored as uint8: a quarter of the float32 footprint in the cache
+        return tf.cast(tf.clip_by_value(tf.round(image), 0, 255), tf.uint8)
+    
+    def build_dali_dataset(self, file_paths, labels, num_classes):
+        """
+        Build the training input with NVIDIA DALI
         
-        # In practice, you'd have a separate test set
-        test_ds = val_ds
+        JPEGs are decoded on the GPU by nvJPEG and resized there, so the
+        CPU only reads files. Random augmentation is not repeated here: it
+        already runs on the GPU inside the model (see build_augmentation).
         
-        return train_ds, val_ds, test_ds
+        Args:
+            file_paths: Training image paths
+            labels: Integer label per path
+            num_classes: Number of classes for the one-hot labels
+            
+        Returns:
+            Batched dataset of ([0, 1] images, one-hot labels) on the GPU,
+            or None if DALI can't be used (the tf.data pipeline is used)
+        """
+        try:
+            from nvidia.dali import pipeline_def, fn, types
+            import nvidia.dali.plugin.tf as dali_tf
+        except ImportError:
+            print("DALI not installed, using the tf.data input pipeline")
+            return None
+        
+        if not tf.config.list_physical_devices('GPU') or self.num_replicas > 1:
+            print("DALI input needs exactly one GPU, using the tf.data input pipeline")
+            return None
+        
+        # Keras applies class_weight with a .map over the input dataset,
+        # which a GPU-placed DALIDataset doesn't support
+        if self.class_weight is not None:
+            print("DALI input doesn't support class weights "
+                  "(training.use_class_weights), using the tf.data input pipeline")
+            return None
+        
+        batch_size = self.config['data']['batch_size']
+        height, width = self.config['data']['image_size']
+        
+        @pipeline_def(batch_size=batch_size, num_threads=os.cpu_count() or 1, device_id=0, seed=42)
+        def training_pipeline():
+            jpegs, label = fn.readers.file(
+                files=list(file_paths), labels=[int(l) for l in labels],
+                random_shuffle=True, name='Reader'
+            )
+            # 'mixed': Huffman decoding on the CPU, IDCT on the GPU
+            images = fn.decoders.image(jpegs, device='mixed', output_type=types.RGB)
+            images = fn.resize(images, resize_x=width, resize_y=height)
+            # Scale to [0, 1] like the tf.data pipeline
+            images = fn.crop_mirror_normalize(
+                images, dtype=types.FLOAT, output_layout='HWC',
+                mean=[0.0, 0.0, 0.0], std=[255.0, 255.0, 255.0]
+            )
+            label = fn.one_hot(label, num_classes=num_classes, dtype=types.FLOAT)
+            return images, label.gpu()
+        
+        with tf.device('/gpu:0'):
+            ds = dali_tf.DALIDataset(
+                pipeline=training_pipeline(),
+                batch_size=batch_size,
+                output_shapes=((batch_size, height, width, 3), (batch_size, num_classes)),
+                output_dtypes=(tf.float32, tf.float32),
+                device_id=0
+            )
+        
+        # DALI iterates without epoch boundaries, so fit needs the length
+        self.steps_per_epoch = -(-len(file_paths) // batch_size)
+        print("Using DALI GPU decoding for the training input")
+        return ds
+    
+    def prepare_dataset(self, ds, subset, cache_key, training=False, cache=True):
+        """
+        Cache decoded images, then shuffle, batch, rescale and prefetch
+        
+        Only the deterministic decode + resize is cached, so epochs after
+        the first skip JPEG decoding; shuffling stays random per epoch and
+        augmentation runs later inside the model.
+        
+        Args:
+            ds: Unbatched dataset of (uint8 image, one-hot label)
+            subset: Cache file name prefix ('train', 'val' or 'test')
+            cache_key: Fingerprint of the subset's files (see file_list_hash),
+                so a changed split never reuses a stale cache file
+            training: Shuffle every epoch
+            cache: Cache decoded images (skip for data read only once)
+            
+        Returns:
+            Batched dataset of [0, 1] images, prefetched to the GPU if present
+        """
+        batch_size = self.config['data']['batch_size']
+        cache_dir = self.config['data']['cache_dir']
+        width, height = self.config['data']['image_size']
+        
+        # Rescale to [0, 1]; augmentation runs batched on the accelerator
+        # inside the model, see create_model
+        def rescale(images, labels):
+            return tf.cast(images, tf.float32) / 255.0, labels
+        
+        if cache and cache_dir:
+            # Keyed by file list and image size; old cache files are left
+            # behind when either changes and can be deleted
+            os.makedirs(cache_dir, exist_ok=True)
+            ds = ds.cache(os.path.join(cache_dir, f"{subset}_{width}x{height}_{cache_key}.tfcache"))
+        elif cache:
+            ds = ds.cache()
+        
+        if training:
+            ds = ds.shuffle(self.config['data']['shuffle_buffer'], seed=42, reshuffle_each_iteration=True)
+        
+        # Parallel map and prefetch overlap input work with training steps
+        ds = ds.batch(batch_size).map(rescale, num_parallel_calls=tf.data.AUTOTUNE)
+        
+        # Fuse batch+map, batch in parallel, and give the pipeline its own
+        # threads so it doesn't contend with the training runtime's pool
+        options = tf.data.Options()
+        options.experimental_optimization.map_and_batch_fusion = True
+        options.experimental_optimization.map_parallelization = True
+        options.experimental_optimization.parallel_batch = True
+        options.threading.private_threadpool_size = os.cpu_count() or 1
+        # Training order is shuffled anyway, so let elements arrive as ready
+        options.deterministic = not training
+        ds = ds.with_options(options)
+        
+        # Stage the next batches in GPU memory so the host-to-device copy
+        # is off the step's critical path; must be the last transformation.
+        # With several replicas the distributed iterator does this per GPU
+        if self.num_replicas == 1 and tf.config.list_physical_devices('GPU'):
+            return ds.apply(tf.data.experimental.prefetch_to_device('/gpu:0', buffer_size=2))
+        
+        return ds.prefetch(tf.data.AUTOTUNE)
+    
+    def build_augmentation(self):
+        """
+        Build the training augmentation from the 'augmentation' config
+        
+        Returns:
+            Keras Sequential of random preprocessing layers
+        """
+        aug_config = self.config['augmentation']
+        
+        flip_modes = []
+        if aug_config['horizontal_flip']:
+            flip_modes.append('horizontal')
+        if aug_config['vertical_flip']:
+            flip_modes.append('vertical')
+        
+        brightness_low, brightness_high = aug_config['brightness_range']
+        
+        augmentation_layers = [
+            layers.RandomRotation(aug_config['rotation_range'] / 360, fill_mode=aug_config['fill_mode']),
+            layers.RandomTranslation(aug_config['height_shift_range'], aug_config['width_shift_range'],
+                                     fill_mode=aug_config['fill_mode']),
+            layers.RandomZoom(aug_config['zoom_range'], fill_mode=aug_config['fill_mode']),
+            layers.RandomBrightness((brightness_low - 1, brightness_high - 1), value_range=(0, 1)),
+            layers.RandomContrast(aug_config['contrast_range'])
+        ]
+        if flip_modes:
+            augmentation_layers.insert(0, layers.RandomFlip('_and_'.join(flip_modes)))
+        
+        return keras.Sequential(augmentation_layers, name='augmentation')
     
     def create_model(self):
         """
@@ -226,22 +709,32 @@ class PlantDiseaseModel:
         else:
             raise ValueError(f"Unsupported base model: {base_model_name}")
         
-        # Freeze base model layers
+        # Freeze base model layers (the top ones are unfrozen for
+        # fine-tuning, see unfreeze_top_layers)
         base_model.trainable = False
+        self.base_model = base_model
         
         # Create new model on top
         inputs = keras.Input(shape=input_shape)
         
-        # Data augmentation
-        x = layers.RandomFlip("horizontal")(inputs)
-        x = layers.RandomRotation(0.1)(x)
-        x = layers.RandomZoom(0.1)(x)
+        # Data augmentation: one batched layer stack in the model graph, so
+        # it runs on the GPU during training and is a no-op at inference
+        x = inputs
+        if self.config['training']['use_augmentation']:
+            x = self.build_augmentation()(x)
         
-        # Preprocess input according to base model requirements
-        if base_model_name in ['MobileNetV2', 'EfficientNetB0']:
-            x = applications.mobilenet_v2.preprocess_input(x)
+        # Preprocess input according to base model requirements. The
+        # pipeline feeds [0, 1] images, so fold the x255 into one affine
+        # layer XLA can fuse with the augmentation ops
+        if base_model_name == 'MobileNetV2':
+            # preprocess_input(x * 255) == x * 2 - 1
+            x = layers.Rescaling(2.0, offset=-1.0, name='preprocess')(x)
+        elif base_model_name == 'EfficientNetB0':
+            # EfficientNet normalizes internally and expects raw [0, 255];
+            # efficientnet.preprocess_input is a pass-through
+            x = layers.Rescaling(255.0, name='preprocess')(x)
         elif base_model_name == 'ResNet50':
-            x = applications.resnet50.preprocess_input(x)
+            x = applications.resnet50.preprocess_input(x * 255.0)
         
         # Base model
         x = base_model(x, training=False)
@@ -258,31 +751,37 @@ class PlantDiseaseModel:
         x = layers.BatchNormalization()(x)
         x = layers.Dropout(dropout_rate)(x)
         
-        # Output layer
-        outputs = layers.Dense(num_classes, activation='softmax')(x)
+        # Output layer (float32 softmax keeps the loss numerically stable
+        # under mixed precision)
+        outputs = layers.Dense(num_classes, activation='softmax', dtype='float32')(x)
         
         # Create model
         model = keras.Model(inputs, outputs)
         
         return model
     
-    def compile_model(self, model):
+    def compile_model(self, model, learning_rate=None):
         """
         Compile the model with optimizer and loss
         
         Args:
             model: Keras model to compile
+            learning_rate: Optimizer learning rate (default: the model config's)
             
         Returns:
             Compiled model
         """
         print("Compiling model...")
         
-        learning_rate = self.config['model']['learning_rate']
+        if learning_rate is None:
+            learning_rate = self.config['model']['learning_rate']
         
         optimizer = keras.optimizers.Adam(learning_rate=learning_rate)
+        if self.mixed_precision:
+            # Scale the loss so float16 gradients don't underflow
+            optimizer = keras.mixed_precision.LossScaleOptimizer(optimizer)
         
-        model.compile(
+        compile_kwargs = dict(
             optimizer=optimizer,
             loss='categorical_crossentropy',
             metrics=[
@@ -293,6 +792,17 @@ class PlantDiseaseModel:
             ]
         )
         
+        # XLA fuses the elementwise chains (BatchNorm + ReLU + Dropout,
+        # rescaling) into fewer GPU kernels
+        if self.config['training']['jit_compile']:
+            try:
+                model.compile(jit_compile=True, **compile_kwargs)
+            except (TypeError, ValueError) as e:
+                print(f"XLA unavailable ({e}), compiling without jit_compile")
+                model.compile(**compile_kwargs)
+        else:
+            model.compile(**compile_kwargs)
+        
         model.summary()
         
         return model
@@ -318,15 +828,13 @@ class PlantDiseaseModel:
         # Model checkpoint
         checkpoint_path = os.path.join(
             self.config['paths']['checkpoints_dir'],
-            'best_model.weights.h5'
+            'best_model.weights.npz'
         )
         
-        checkpoint_cb = keras.callbacks.ModelCheckpoint(
+        checkpoint_cb = AsyncCheckpoint(
             filepath=checkpoint_path,
             monitor='val_accuracy',
-            save_best_only=self.config['tracking']['save_best_only'],
-            save_weights_only=True,
-            verbose=1
+            save_best_only=self.config['tracking']['save_best_only']
         )
         callbacks.append(checkpoint_cb)
         
@@ -354,25 +862,24 @@ class PlantDiseaseModel:
             self.config['paths']['logs_dir'],
             datetime.now().strftime("%Y%m%d-%H%M%S")
         )
+        # Weight histograms walk every variable each time; off by default
         tensorboard_cb = keras.callbacks.TensorBoard(
             log_dir=log_dir,
-            histogram_freq=1
+            histogram_freq=self.config['tracking']['tb_histogram_freq'],
+            profile_batch=0,
+            write_graph=False
         )
         callbacks.append(tensorboard_cb)
         
         # MLflow callback
         if self.config['tracking']['use_mlflow']:
-            mlflow_cb = mlflow.keras.MlflowCallback()
+            import mlflow
+            import mlflow.tensorflow
+            mlflow_cb = MlflowBatchLogger(flush_every=self.config['tracking']['mlflow_log_every'])
             callbacks.append(mlflow_cb)
         
-        # Calculate class weights if needed
-        class_weight = None
-        if self.config['training']['use_class_weights']:
-            # This is simplified - in practice, calculate from your dataset
-            class_weight = 'balanced'
-        
         # Train the model
-        with mlflow.start_run() if self.config['tracking']['use_mlflow'] else None:
+        with mlflow.start_run() if self.config['tracking']['use_mlflow'] else contextlib.nullcontext():
             # Log parameters
             if self.config['tracking']['use_mlflow']:
                 mlflow.log_params({
@@ -383,16 +890,39 @@ class PlantDiseaseModel:
                     'image_size': self.config['data']['image_size']
                 })
             
-            # Train
+            # Phase 1: train only the new head on the frozen base
+            head_epochs = min(self.config['training']['head_epochs'], epochs)
             history = self.model.fit(
                 train_ds,
-                epochs=epochs,
+                epochs=head_epochs,
+                steps_per_epoch=self.steps_per_epoch,
                 validation_data=val_ds,
                 callbacks=callbacks,
-                class_weight=class_weight,
+                class_weight=self.class_weight,
                 verbose=1
             )
             
+            # Phase 2: fine-tune the top of the base with a low learning
+            # rate so the pretrained features aren't wrecked
+            if epochs > head_epochs:
+                self.unfreeze_top_layers(self.config['training']['fine_tune_layers'])
+                fine_tune_lr = self.config['training']['fine_tune_learning_rate'] * self.num_replicas
+                with self.strategy.scope():
+                    self.model = self.compile_model(self.model, learning_rate=fine_tune_lr)
+                
+                fine_tune_history = self.model.fit(
+                    train_ds,
+                    epochs=epochs,
+                    initial_epoch=head_epochs,
+                    steps_per_epoch=self.steps_per_epoch,
+                    validation_data=val_ds,
+                    callbacks=callbacks,
+                    class_weight=self.class_weight,
+                    verbose=1
+                )
+                for key, values in fine_tune_history.history.items():
+                    history.history.setdefault(key, []).extend(values)
+            
             # Log metrics
             if self.config['tracking']['use_mlflow']:
                 mlflow.log_metrics({
@@ -411,6 +941,24 @@ class PlantDiseaseModel:
         
         return history
     
+    def unfreeze_top_layers(self, num_layers):
+        """
+        Make the top layers of the base model trainable
+        
+        BatchNormalization layers stay frozen: their statistics come from
+        ImageNet and small fine-tuning batches would corrupt them.
+        
+        Args:
+            num_layers: Number of layers, counted from the top, to unfreeze
+        """
+        self.base_model.trainable = True
+        
+        cutoff = len(self.base_model.layers) - num_layers
+        for i, layer in enumerate(self.base_model.layers):
+            layer.trainable = i >= cutoff and not isinstance(layer, layers.BatchNormalization)
+        
+        print(f"Fine-tuning the top {num_layers} of {len(self.base_model.layers)} base layers")
+    
     def evaluate_model(self, test_ds):
         """
         Evaluate the trained model
@@ -426,14 +974,19 @@ class PlantDiseaseModel:
         # Load best weights
         checkpoint_path = os.path.join(
             self.config['paths']['checkpoints_dir'],
-            'best_model.weights.h5'
+            'best_model.weights.npz'
         )
         
         if os.path.exists(checkpoint_path):
-            self.model.load_weights(checkpoint_path)
+            # Written by AsyncCheckpoint: arrays in get_weights() order
+            with np.load(checkpoint_path) as checkpoint:
+                self.model.set_weights([checkpoint[f'arr_{i}'] for i in range(len(checkpoint.files))])
             print("Loaded best model weights from checkpoint")
         
-        # Evaluate
+        # Evaluate. Metrics are computed in-graph, so no batch is copied
+        # out to numpy; if predictions are ever pulled out (e.g. for
+        # sklearn reports), use np.asarray(tensor), which shares the eager
+        # tensor's host buffer, rather than np.array(), which copies
         results = self.model.evaluate(test_ds, verbose=1)
         
         metrics = {
@@ -450,12 +1003,16 @@ class PlantDiseaseModel:
         
         return metrics
     
-    def save_model(self, format='both'):
+    def save_model(self, format='both', representative_ds=None):
         """
         Save the trained model in different formats
         
         Args:
             format: 'h5', 'tflite', or 'both'
+            representative_ds: Unbatched host-side dataset of (image, label)
+                used to calibrate full INT8 quantization of the TFLite
+                model. Without it the TFLite model is exported with
+                float16 weights.
         """
         print("Saving model...")
         
@@ -470,10 +1027,36 @@ class PlantDiseaseModel:
         
         # Save as TensorFlow Lite
         if format in ['tflite', 'both']:
+            # A mixed_float16 model carries float16 compute and Cast ops
+            # that the INT8/float16 converters can't handle cleanly:
+            # rebuild it in float32 and copy the trained weights over
+            export_model = self.model
+            if self.mixed_precision:
+                keras.mixed_precision.set_global_policy('float32')
+                trained_base_model = self.base_model
+                export_model = self.create_model()
+                export_model.set_weights(self.model.get_weights())
+                self.base_model = trained_base_model
+            
             # Convert to TFLite
-            converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+            converter = tf.lite.TFLiteConverter.from_keras_model(export_model)
             converter.optimizations = [tf.lite.Optimize.DEFAULT]
-            converter.target_spec.supported_types = [tf.float16]
+            
+            if representative_ds is not None:
+                # Full INT8 post-training quantization of weights and
+                # activations, calibrated on ~100 images
+                def representative_data():
+                    for image, _ in representative_ds.take(100):
+                        yield [tf.cast(image[tf.newaxis], tf.float32)]
+                
+                converter.representative_dataset = representative_data
+                converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+                # uint8 I/O matches camera pixels; the backend predictor
+                # reads the input/output quantization params from the model
+                converter.inference_input_type = tf.uint8
+                converter.inference_output_type = tf.uint8
+            else:
+                converter.target_spec.supported_types = [tf.float16]
             
             tflite_model = converter.convert()
             
@@ -512,6 +1095,8 @@ class PlantDiseaseModel:
             print("No training history to plot")
             return
         
+        import matplotlib.pyplot as plt
+        
         fig, axes = plt.subplots(2, 2, figsize=(12, 8))
         
         # Accuracy
@@ -570,12 +1155,25 @@ class PlantDiseaseModel:
         print("Mkulima AI Model Training")
         print("=" * 50)
         
+        # Replicate across all local GPUs (all-reduce of gradients); with a
+        # single device this behaves like plain training
+        self.strategy = tf.distribute.MirroredStrategy()
+        self.num_replicas = self.strategy.num_replicas_in_sync
+        if self.num_replicas > 1:
+            # Keep the per-GPU batch; scale the learning rate with the
+            # global batch
+            self.config['data']['batch_size'] *= self.num_replicas
+            self.config['model']['learning_rate'] *= self.num_replicas
+            print(f"Training on {self.num_replicas} replicas, "
+                  f"global batch size {self.config['data']['batch_size']}")
+        
         # Load data
         train_ds, val_ds, test_ds = self.load_dataset()
         
-        # Create model
-        self.model = self.create_model()
-        self.model = self.compile_model(self.model)
+        # Create model (variables are mirrored on every replica)
+        with self.strategy.scope():
+            self.model = self.create_model()
+            self.model = self.compile_model(self.model)
         
         # Train model
         self.history = self.train_model(train_ds, val_ds)
@@ -584,7 +1182,7 @@ class PlantDiseaseModel:
         metrics = self.evaluate_model(test_ds)
         
         # Save model
-        self.save_model(format='both')
+        self.save_model(format='both', representative_ds=self.calibration_ds)
         
         # Plot history
         self.plot_training_history()
@@ -601,6 +1199,8 @@ def main():
                        help='Number of training epochs')
     parser.add_argument('--batch_size', type=int, default=None,
                        help='Batch size for training')
+    parser.add_argument('--build_tfrecords', action='store_true',
+                       help='Pack the dataset into TFRecord shards before training')
     
     args = parser.parse_args()
     
@@ -613,6 +1213,9 @@ def main():
     if args.batch_size:
         trainer.config['data']['batch_size'] = args.batch_size
     
+    if args.build_tfrecords:
+        trainer.build_tfrecords()
+    
     # Run training
     trainer.run()
 
@@ -151,12 +151,8 @@ cd backend
 # Check if gunicorn is available for production
 if [[ "$1" == "--production" ]] && command -v gunicorn &> /dev/null; then
     print_message "Starting production server with gunicorn..."
-    gunicorn --bind 0.0.0.0:$PORT \
-             --workers 4 \
-             --timeout 120 \
-             --log-level info \
-             --access-logfile logs/access.log \
-             --error-logfile logs/error.log \
+    gunicorn --config gunicorn_conf.py \
+             --bind 0.0.0.0:$PORT \
              app:app
 else
     if [[ "$1" == "--production" ]]; then